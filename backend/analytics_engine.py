@@ -0,0 +1,155 @@
+import numpy as np
+
+NUMERIC = {
+    'mal_id': np.int64, 'score': np.float64, 'rank': np.int64, 'popularity': np.int64,
+    'episodes': np.int64, 'duration_mins': np.int64, 'year': np.int64
+}
+SINGLE = ('source',)
+MULTI = ('genres', 'studios', 'demographics')
+TEXT = ('title', 'baha_title', 'img_url', 'aired_from')
+
+EP_BUCKETS = ("Movie/OVA (1)", "Short (2-13)", "Medium (14-26)", "Long (27+)")
+
+
+def _to_int(v):
+    try: return int(v)
+    except (TypeError, ValueError): return 0
+
+
+class AnalyticsFrame:
+    """Columnar view of a watch list: NumPy arrays for numbers, integer codes for categories.
+
+    Multi-valued columns (genres, studios, demographics) are stored flat as
+    `codes` plus an `owner` array holding the row each code belongs to.
+    Labels keep first-appearance order, so ties rank the same way
+    Counter.most_common did.
+    """
+
+    def __init__(self, n, num, single, multi, text):
+        self.n = n
+        self.num = num
+        self.single = single
+        self.multi = multi
+        self.text = text
+
+    @classmethod
+    def from_records(cls, records):
+        n = len(records)
+        num = {c: np.array([_to_int(r.get(c)) if t is np.int64 else (r.get(c) or 0) for r in records], dtype=t)
+               for c, t in NUMERIC.items()}
+        single = {}
+        for c in SINGLE:
+            labels, codes = {}, []
+            for r in records:
+                v = r.get(c)
+                codes.append(labels.setdefault(v, len(labels)) if v else -1)
+            single[c] = (list(labels), np.array(codes, dtype=np.int64))
+        multi = {}
+        for c in MULTI:
+            labels, codes, owner = {}, [], []
+            for i, r in enumerate(records):
+                for v in r.get(c) or []:
+                    codes.append(labels.setdefault(v, len(labels)))
+                    owner.append(i)
+            multi[c] = (list(labels), np.array(codes, dtype=np.int64), np.array(owner, dtype=np.int64))
+        text = {c: [r.get(c) for r in records] for c in TEXT}
+        return cls(n, num, single, multi, text)
+
+    def to_dict(self):
+        # Plain lists so the frame survives any state backend (including JSON/SQLite)
+        return {
+            'n': self.n,
+            'num': {c: a.tolist() for c, a in self.num.items()},
+            'single': {c: {'labels': l, 'codes': a.tolist()} for c, (l, a) in self.single.items()},
+            'multi': {c: {'labels': l, 'codes': a.tolist(), 'owner': o.tolist()} for c, (l, a, o) in self.multi.items()},
+            'text': self.text
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(
+            d['n'],
+            {c: np.array(v, dtype=NUMERIC[c]) for c, v in d['num'].items()},
+            {c: (v['labels'], np.array(v['codes'], dtype=np.int64)) for c, v in d['single'].items()},
+            {c: (v['labels'], np.array(v['codes'], dtype=np.int64), np.array(v['owner'], dtype=np.int64))
+             for c, v in d['multi'].items()},
+            d['text']
+        )
+
+    def rows(self):
+        out = []
+        # owner is non-decreasing, so each row's codes are one contiguous slice
+        bounds = {c: np.searchsorted(self.multi[c][2], np.arange(self.n + 1)) for c in MULTI}
+        for i in range(self.n):
+            row = {c: self.text[c][i] for c in TEXT}
+            for c in NUMERIC:
+                row[c] = self.num[c][i].item()
+            row['year'] = row['year'] or None
+            for c in SINGLE:
+                labels, codes = self.single[c]
+                row[c] = labels[codes[i]] if codes[i] >= 0 else None
+            for c in MULTI:
+                labels, codes, _ = self.multi[c]
+                row[c] = [labels[k] for k in codes[bounds[c][i]:bounds[c][i + 1]]]
+            out.append(row)
+        return out
+
+    def _ranked_counts(self, labels, codes, top=None):
+        counts = np.bincount(codes[codes >= 0], minlength=len(labels))
+        order = np.lexsort((np.arange(len(labels)), -counts))
+        order = [k for k in order if counts[k] > 0][:top]
+        return {labels[k]: int(counts[k]) for k in order}
+
+    def _leaderboard(self, col):
+        vals = self.num[col]
+        idx = np.flatnonzero((vals > 0) & (vals < 99999))
+        idx = idx[np.argsort(vals[idx], kind='stable')]
+        titles, fallback, imgs = self.text['baha_title'], self.text['title'], self.text['img_url']
+        return [{'title': titles[i] or fallback[i], 'val': int(vals[i]), 'img': imgs[i]} for i in idx]
+
+    def compute_stats(self):
+        n = self.num
+        eps, mins, year, score = n['episodes'], n['duration_mins'], n['year'], n['score']
+
+        # Years: first-appearance order breaks ties, like Counter.most_common
+        valid_years = year[year > 0]
+        uniq, first, counts = np.unique(valid_years, return_index=True, return_counts=True)
+        order = np.lexsort((first, -counts))
+        years = {str(int(uniq[k])): int(counts[k]) for k in order}
+
+        bucket = np.select([eps == 1, (eps > 1) & (eps <= 13), (eps > 13) & (eps <= 26), eps > 26], [0, 1, 2, 3], -1)
+        bucket_counts = np.bincount(bucket[bucket >= 0], minlength=4)
+
+        scored = score[score > 0]
+        genre_labels, genre_codes, genre_owner = self.multi['genres']
+
+        # Year x genre matrix over the ten most common genres
+        top_genres = list(self._ranked_counts(genre_labels, genre_codes, 10))
+        year_axis = sorted(int(y) for y in years)
+        matrix = np.zeros((len(year_axis), len(top_genres)), dtype=np.int64)
+        if top_genres and year_axis:
+            col_of = np.full(len(genre_labels), -1)
+            col_of[[genre_labels.index(g) for g in top_genres]] = np.arange(len(top_genres))
+            g_year = year[genre_owner]
+            cols = col_of[genre_codes]
+            keep = (cols >= 0) & (g_year > 0)
+            rows_idx = np.searchsorted(year_axis, g_year[keep])
+            np.add.at(matrix, (rows_idx, cols[keep]), 1)
+
+        return {
+            'years': years,
+            'genres': self._ranked_counts(genre_labels, genre_codes, 10),
+            'studios': self._ranked_counts(*self.multi['studios'][:2], 8),
+            'sources': self._ranked_counts(*self.single['source']),
+            'demographics': self._ranked_counts(*self.multi['demographics'][:2]),
+            'ep_prefs': {label: int(c) for label, c in zip(EP_BUCKETS, bucket_counts)},
+            'total_eps': int(eps.sum()),
+            'total_hours': round(int((eps * mins).sum()) / 60),
+            'avg_score': round(sum(scored.tolist()) / scored.size, 2) if scored.size else 0,
+            'total_watched': self.n,
+            'all_ranked': self._leaderboard('rank'),
+            'all_popular': self._leaderboard('popularity'),
+            'score_percentiles': {f'p{p}': round(float(v), 2) for p, v in zip(
+                (10, 25, 50, 75, 90), np.percentile(scored, (10, 25, 50, 75, 90)))} if scored.size else {},
+            'year_genre': {'years': year_axis, 'genres': top_genres, 'matrix': matrix.tolist()}
+        }
@@ -1,8 +1,11 @@
-import json
-from collections import Counter
+import threading
+import uuid
+from collections import OrderedDict
 from flask import Blueprint, request, session, jsonify, Response
 
+from analytics_engine import AnalyticsFrame
 from core_logic import MalAnalyticsFetcher
+from jobs import job_stream
 from state import ANALYTICS_QUEUE, ANALYTICS_RESULTS
 
 analytics_bp = Blueprint('analytics', __name__)
@@ -23,7 +26,7 @@ def stream_analytics():
         
         for idx, item in enumerate(q):
             title = item.get('baha_title', 'Unknown')
-            yield f"data: {json.dumps({'msg': f'Extracting: {title} [{idx+1}/{total}]', 'progress': f'{int(((idx+1)/total)*100)}%'})}\n\n"
+            yield {'msg': f'Extracting: {title} [{idx+1}/{total}]', 'progress': f'{int(((idx+1)/total)*100)}%'}
             
             details = fetcher.fetch_details(item['mal_id'])
             if details:
@@ -32,74 +35,66 @@ def stream_analytics():
                 details['img_url'] = item.get('img_url')
                 results.append(details)
                 
-        ANALYTICS_RESULTS[sid] = results
-        yield f"data: {json.dumps({'done': True})}\n\n"
-        yield ": keep-alive\n\n"
+        # Computed once here; GET /api/analytics only slices the snapshot
+        ANALYTICS_RESULTS[sid] = build_snapshot(results)
+        yield {'done': True}
         
-    return Response(generate(), mimetype='text/event-stream')
+    return job_stream(sid, 'analytics', {'user_id': user_id}, generate)
+
+_PAGED_FIELDS = ('raw_data', 'all_ranked', 'all_popular')
+
+# raw_data rows materialized from recent snapshots, keyed by snapshot token
+_rows_cache = OrderedDict()
+_rows_lock = threading.Lock()
+_ROWS_CACHE_SIZE = 16
+
+def build_snapshot(data):
+    frame = AnalyticsFrame.from_records(data)
+    return {'token': uuid.uuid4().hex, 'frame': frame.to_dict(), 'stats': frame.compute_stats()}
+
+def snapshot_rows(snapshot):
+    token = snapshot['token']
+    with _rows_lock:
+        if token in _rows_cache:
+            _rows_cache.move_to_end(token)
+            return _rows_cache[token]
+    rows = AnalyticsFrame.from_dict(snapshot['frame']).rows()
+    with _rows_lock:
+        _rows_cache[token] = rows
+        while len(_rows_cache) > _ROWS_CACHE_SIZE:
+            _rows_cache.popitem(last=False)
+    return rows
 
 @analytics_bp.route('/analytics')
 def get_analytics():
     sid = session['uid']
-    data = ANALYTICS_RESULTS.get(sid)
+    snapshot = ANALYTICS_RESULTS.get(sid)
     
-    if not data:
+    if not snapshot or not snapshot['stats']['total_watched']:
         return jsonify({'ok': False, 'error': 'No analytics data available'})
-    
-    years = [str(i['year']) for i in data if i.get('year')]
-    genres = [g for i in data for g in i.get('genres', [])]
-    studios = [s for i in data for s in i.get('studios', [])]
-    sources = [i.get('source') for i in data if i.get('source')]
-    scores = [i.get('score') for i in data if i.get('score') > 0]
-    
-    demographics = [d for i in data for d in i.get('demographics', [])]
-    total_eps = 0
-    total_mins = 0
-    ep_prefs = {"Movie/OVA (1)": 0, "Short (2-13)": 0, "Medium (14-26)": 0, "Long (27+)": 0}
 
-    for i in data:
-        eps = i.get('episodes', 0)
-        mins = i.get('duration_mins', 0)
-        
-        total_eps += eps
-        total_mins += (eps * mins)
-        
-        if eps == 1:
-            ep_prefs["Movie/OVA (1)"] += 1
-        elif 1 < eps <= 13:
-            ep_prefs["Short (2-13)"] += 1
-        elif 13 < eps <= 26:
-            ep_prefs["Medium (14-26)"] += 1
-        elif eps > 26:
-            ep_prefs["Long (27+)"] += 1
-
-    total_hours = round(total_mins / 60)
+    # ?fields=a,b selects keys; ?offset=&limit= page raw_data / all_ranked / all_popular
+    stats = snapshot['stats']
+    fields = request.args.get('fields')
+    wanted = fields.split(',') if fields else list(stats) + ['raw_data']
+    offset = max(request.args.get('offset', type=int, default=0), 0)
+    limit = request.args.get('limit', type=int)
+    end = offset + limit if limit is not None else None
 
-    ranked_data = [i for i in data if i.get('rank') and i.get('rank') < 99999]
-    ranked_data.sort(key=lambda x: x['rank'])
-    all_ranked = [{'title': i.get('baha_title') or i['title'], 'val': i['rank'], 'img': i.get('img_url')} for i in ranked_data]
+    result = {}
+    totals = {}
+    for k in wanted:
+        if k == 'raw_data':
+            result[k] = snapshot_rows(snapshot)[offset:end]
+            totals[k] = stats['total_watched']
+        elif k in _PAGED_FIELDS:
+            result[k] = stats[k][offset:end]
+            totals[k] = len(stats[k])
+        elif k in stats:
+            result[k] = stats[k]
 
-    pop_data = [i for i in data if i.get('popularity') and i.get('popularity') < 99999]
-    pop_data.sort(key=lambda x: x['popularity'])
-    all_pop = [{'title': i.get('baha_title') or i['title'], 'val': i['popularity'], 'img': i.get('img_url')} for i in pop_data]
-    
-    stats = {
-        'years': dict(Counter(years).most_common()),
-        'genres': dict(Counter(genres).most_common(10)),
-        'studios': dict(Counter(studios).most_common(8)),
-        'sources': dict(Counter(sources).most_common()),
-        'demographics': dict(Counter(demographics).most_common()),
-        'ep_prefs': ep_prefs,
-        'total_eps': total_eps,
-        'total_hours': total_hours,
-        'avg_score': round(sum(scores)/len(scores), 2) if scores else 0,
-        'total_watched': len(data),
-        'all_ranked': all_ranked,
-        'all_popular': all_pop,
-        'raw_data': data
-    }
-    
     return jsonify({
         'ok': True,
-        'stats': stats
+        'stats': result,
+        'totals': totals
     })
@@ -1,21 +1,59 @@
+from urllib.parse import urlsplit
+
 import requests
-from flask import Blueprint, request, Response, session, jsonify
+from flask import Blueprint, request, Response, session, jsonify, send_file
+from requests.adapters import HTTPAdapter
+
+from core_logic import AudioCache, MalMatcher, ThemeCacheManager, ThemeDownloader, TitleIndex
+from fetch_engine import FetchEngine
+from jobs import JobManager
+from ratelimit import ANIMETHEMES_LIMITER, JIKAN_LIMITER
+from state import state_stats
 
 common_bp = Blueprint('common', __name__)
 
+# Pooled upstream connections shared by every proxied request
+_proxy_session = requests.Session()
+_proxy_session.headers.update({'User-Agent': 'Mozilla/5.0'})
+_proxy_adapter = HTTPAdapter(pool_connections=16, pool_maxsize=64)
+_proxy_session.mount('http://', _proxy_adapter)
+_proxy_session.mount('https://', _proxy_adapter)
+
+_PASSTHROUGH_HEADERS = ('Content-Type', 'Content-Length', 'Content-Range', 'Accept-Ranges')
+
 @common_bp.route('/audio-proxy')
 def audio_proxy():
     url = request.args.get('url')
     if not url: return "URL parameter is missing", 400
+
+    cacheable = (urlsplit(url).hostname or '').endswith('animethemes.moe')
+    if cacheable:
+        path = AudioCache().get(url)
+        if path:
+            # send_file answers Range requests with 206 + Content-Range
+            return send_file(path, conditional=True)
+
+    headers = {}
+    if request.headers.get('Range'):
+        headers['Range'] = request.headers['Range']
     try:
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        with requests.Session() as req_session:
-            res = req_session.get(url, stream=True, timeout=15, headers=headers)
-            res.raise_for_status()
-            return Response(res.iter_content(chunk_size=8192), content_type=res.headers.get('Content-Type'))
+        res = _proxy_session.get(url, stream=True, timeout=15, headers=headers)
+        res.raise_for_status()
     except requests.exceptions.RequestException as e:
         return str(e), 502
 
+    if cacheable:
+        AudioCache().warm(url, ThemeDownloader())
+
+    response = Response(
+        res.iter_content(chunk_size=64 * 1024),
+        status=res.status_code,
+        headers={h: res.headers[h] for h in _PASSTHROUGH_HEADERS if h in res.headers},
+        direct_passthrough=True
+    )
+    response.call_on_close(res.close)
+    return response
+
 @common_bp.route('/sid')
 def get_session_id():
     return jsonify({'sid': session['uid']})
@@ -23,3 +61,17 @@ def get_session_id():
 @common_bp.route('/ping')
 def ping():
     return "OK", 200
+
+@common_bp.route('/stats')
+def get_stats():
+    return jsonify({
+        'jikan': JIKAN_LIMITER.stats(),
+        'animethemes': ANIMETHEMES_LIMITER.stats(),
+        'jikan_search': MalMatcher.search_stats(),
+        'themes': ThemeCacheManager().stats(),
+        'fetch': FetchEngine().stats(),
+        'title_index': TitleIndex().stats(),
+        'audio_cache': AudioCache().stats(),
+        'jobs': JobManager().stats(),
+        'state': state_stats()
+    })
@@ -1,8 +1,10 @@
-import json
 import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from config import Config
 from core_logic import BahamutCrawler, MalMatcher
-from flask import Blueprint, Response, request, session
+from flask import Blueprint, request, session
+from jobs import job_stream
 from services.sheets_service import log_candidates_to_sheet
 from state import TEMP_RESULTS, USER_SELECTIONS
 
@@ -18,66 +20,89 @@ def stream_progress():
         if sid in USER_SELECTIONS: del USER_SELECTIONS[sid]
         
         crawler = BahamutCrawler(user_id)
-        try: collections = crawler.get_collections()
-        except Exception as e: yield f"data: {json.dumps({'error': str(e)})}\n\n"; return
-        if not collections: yield f"data: {json.dumps({'error': 'No valid collection records detected.'})}\n\n"; return
+        collections = []
+        try:
+            for st in crawler.collections_generator():
+                if st.get('done'):
+                    collections = st['collections']
+                else:
+                    yield {'msg': st['msg']}
+        except Exception as e: yield {'error': str(e)}; return
+        if not collections: yield {'error': 'No valid collection records detected.'}; return
             
         target_list = collections[:int(limit)] if limit and limit.isdigit() else collections
-        yield f"data: {json.dumps({'msg': f'Detected {len(collections)} records. Initializing stream for {len(target_list)} items...'})}\n\n"
+        yield {'msg': f'Detected {len(collections)} records. Initializing stream for {len(target_list)} items...'}
         
         try: details = crawler.fetch_all_details(target_list)
-        except: yield f"data: {json.dumps({'error': 'Data stream extraction failed.'})}\n\n"; return
+        except: yield {'error': 'Data stream extraction failed.'}; return
+        failed = crawler.detail_failures
+        if failed * 2 > len(target_list):
+            yield {'error': f'Data stream extraction failed for {failed}/{len(target_list)} items (upstream blocked or unavailable).'}; return
+        if failed:
+            yield {'msg': f'WARN: {failed} detail requests failed, results may be partial.'}
 
-        yield f"data: {json.dumps({'msg': 'Initiating feature matching protocol...'})}\n\n"
+        yield {'msg': 'Initiating feature matching protocol...'}
         matcher = MalMatcher()
-        results = []
+        rows = {}
         new_candidates = []
         total = len(details)
-        
-        for i, item in enumerate(details):
-            try:
-                mal_data, status = matcher.resolve_mal_id(item)
-                is_low = True
-                if status and (status == "Cache Hit" or status == "High Confidence"):
-                    is_low = False
-                
-                img = mal_data.get('img_url', '') if mal_data else 'https://cdn.myanimelist.net/img/sp/icon/apple-touch-icon-256.png'
-                
-                mal_year = mal_data.get('mal_year') if mal_data else None
-                final_year = mal_year if mal_year else item.get('year')
+        done = 0
 
-                row = {
-                    'id': i,
-                    'baha_title': item['ch_name'],
-                    'mal_title': mal_data['title'] if mal_data else '-',
-                    'mal_id': mal_data['mal_id'] if mal_data else None,
-                    'status': status,
-                    'img_url': img,
-                    'is_low': is_low,
-                    'year': final_year
-                }
-                results.append(row)
-                
-                if status != "Cache Hit" and mal_data:
-                    new_candidates.append(row)
+        ex = ThreadPoolExecutor(max_workers=Config.MATCH_WORKERS)
+        try:
+            futures = {ex.submit(matcher.resolve_mal_id, item): i for i, item in enumerate(details)}
+            for f in as_completed(futures):
+                i = futures[f]
+                item = details[i]
+                done += 1
+                try:
+                    mal_data, status = f.result()
+                    is_low = True
+                    if status and (status in ("Cache Hit", "Index Hit", "High Confidence")):
+                        is_low = False
+
+                    img = mal_data.get('img_url', '') if mal_data else 'https://cdn.myanimelist.net/img/sp/icon/apple-touch-icon-256.png'
+
+                    mal_year = mal_data.get('mal_year') if mal_data else None
+                    final_year = mal_year if mal_year else item.get('year')
+
+                    row = {
+                        'baha_title': item['ch_name'],
+                        'mal_title': mal_data['title'] if mal_data else '-',
+                        'mal_id': mal_data['mal_id'] if mal_data else None,
+                        'status': status,
+                        'img_url': img,
+                        'is_low': is_low,
+                        'year': final_year
+                    }
+                    rows[i] = row
+
+                    if status != "Cache Hit" and mal_data:
+                        new_candidates.append(row)
+
+                    yield {
+                        'type': 'image',
+                        'img_url': img,
+                        'title': item['ch_name'],
+                        'status': status,
+                        'is_low': is_low,
+                        'current': done,
+                        'total': total
+                    }
+                except: continue
+        finally:
+            ex.shutdown(wait=False, cancel_futures=True)
+
+        # Events go out in completion order; ids follow the crawl order
+        results = [rows[i] for i in sorted(rows)]
+        for idx, row in enumerate(results):
+            row['id'] = idx
 
-                yield f"""data: {json.dumps({
-                    'type': 'image',
-                    'img_url': img,
-                    'title': item['ch_name'],
-                    'status': status,
-                    'is_low': is_low,
-                    'current': i+1,
-                    'total': total
-                })}\n\n"""
-            except: continue
-        
         TEMP_RESULTS[sid] = results
         
         if new_candidates:
             threading.Thread(target=log_candidates_to_sheet, args=(new_candidates,)).start()
 
-        yield f"data: {json.dumps({'done': True})}\n\n"
-        yield ": keep-alive\n\n"
+        yield {'done': True}
 
-    return Response(generate(), mimetype='text/event-stream')
+    return job_stream(sid, 'crawl', {'user_id': user_id, 'limit': limit}, generate)
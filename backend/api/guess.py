@@ -1,7 +1,8 @@
 import json
 from flask import Blueprint, request, session, jsonify, Response
 
-from core_logic import BahamutCrawler, ThemeDownloader
+from core_logic import ReviewIndex, ThemeDownloader
+from jobs import job_stream, supersede_jobs
 from state import GAME_QUEUE, READY_PLAYLISTS
 
 guess_bp = Blueprint('guess', __name__)
@@ -42,6 +43,7 @@ def start_guess_game():
             filtered_queue.append(item)
             
     GAME_QUEUE[sid] = filtered_queue
+    supersede_jobs(sid, 'guess-playlist')
     return jsonify({'ok': True})
 
 @guess_bp.route('/stream/guess-playlist')
@@ -52,21 +54,20 @@ def stream_guess_playlist():
         return Response("data: " + json.dumps({'error': 'Session expired or invalid queue.'}) + "\n\n", mimetype='text/event-stream')
     
     def generate():
-        yield f"data: {json.dumps({'msg': 'Fetching reviews for sses3205...', 'progress': '0%'})}\n\n"
-        crawler = BahamutCrawler("sses3205")
-        reviews_dict = crawler.get_reviews("sses3205")
+        yield {'msg': 'Fetching reviews for sses3205...', 'progress': '0%'}
+        reviews_dict = ReviewIndex().get("sses3205")
         
         dl = ThemeDownloader(max_workers=3) 
         try:
             for st in dl.build_playlist_generator(q, reviews_dict):
                 if st.get('done'):
-                    READY_PLAYLISTS[sid] = st.get('playlist', [])
-                yield f"data: {json.dumps(st)}\n\n"
+                    # The client loads it from /guess/playlist; keep it out of the event log
+                    READY_PLAYLISTS[sid] = st.pop('playlist', [])
+                yield st
         except Exception as e: 
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
-        yield ": keep-alive\n\n"
+            yield {'error': str(e)}
         
-    return Response(generate(), mimetype='text/event-stream')
+    return job_stream(sid, 'guess-playlist', {}, generate)
 
 @guess_bp.route('/guess/playlist')
 def get_guess_playlist():
@@ -1,10 +1,11 @@
+import gzip
 import json
-import time
-import requests
 import xml.etree.ElementTree as ET
 from flask import Blueprint, request, session, jsonify, Response
 
-from core_logic import MalMatcher
+from config import Config
+from core_logic import MalAnalyticsFetcher, MalImportTooLarge, get_mapping_index, iter_mal_xml
+from jobs import job_stream, supersede_jobs
 from state import MAL_IMPORT_QUEUE, TEMP_RESULTS
 
 mal_bp = Blueprint('mal', __name__)
@@ -22,34 +23,22 @@ def import_mal_xml():
     user_id = request.form.get('user_id', '').strip() or 'MAL_User'
     
     try:
-        tree = ET.parse(file)
-        root = tree.getroot()
-        parsed_data = []
-        
-        for i, anime in enumerate(root.findall('anime')):
-            mal_id_node = anime.find('series_animedb_id')
-            title_node = anime.find('series_title')
-            
-            if mal_id_node is None or title_node is None:
-                continue
-                
-            mal_id = mal_id_node.text
-            title = title_node.text
-            
-            parsed_data.append({
-                'id': i,
-                'baha_title': title, 
-                'mal_title': title,
-                'mal_id': int(mal_id) if mal_id.isdigit() else None
-            })
+        parsed_data = [
+            {'id': i, 'baha_title': title, 'mal_title': title, 'mal_id': mal_id}
+            for i, mal_id, title in iter_mal_xml(file.stream)
+        ]
             
         if not parsed_data:
             return jsonify({'ok': False, 'error': "XML 檔案中未找到有效的動畫資料。"})
             
         MAL_IMPORT_QUEUE[sid] = parsed_data
+        # A run still importing the previous file would overwrite TEMP_RESULTS with it
+        supersede_jobs(sid, 'mal-import')
         return jsonify({'ok': True, 'user_id': user_id})
         
-    except ET.ParseError:
+    except MalImportTooLarge:
+        return jsonify({'ok': False, 'error': f"檔案過大（上限 {Config.MAL_IMPORT_MAX_BYTES // (1024 * 1024)} MB）。"})
+    except (ET.ParseError, gzip.BadGzipFile, EOFError):
         return jsonify({'ok': False, 'error': "無效的 XML 格式。"})
     except Exception as e:
         return jsonify({'ok': False, 'error': f"解析發生錯誤: {str(e)}"})
@@ -63,64 +52,53 @@ def stream_mal_import():
         return Response("data: " + json.dumps({'error': 'Queue invalid or expired.'}) + "\n\n", mimetype='text/event-stream')
 
     def generate():
-        yield f"data: {json.dumps({'msg': f'Detected {len(q)} records. Fetching metadata...'})}\n\n"
+        yield {'msg': f'Detected {len(q)} records. Fetching metadata...'}
         
-        matcher = MalMatcher()
-        id_cache = {v['mal_id']: v for v in matcher.cache.values() if v.get('mal_id')}
+        id_cache = get_mapping_index().by_id
         
         results = []
         total = len(q)
         
-        with requests.Session() as req_session:
-            for i, item in enumerate(q):
-                mal_id = item['mal_id']
-                title = item['mal_title']
-                
-                img = 'https://cdn.myanimelist.net/img/sp/icon/apple-touch-icon-256.png'
-                year = None
-                status = "MAL Import"
-                is_low = False 
-                
-                if mal_id in id_cache:
-                    cached = id_cache[mal_id]
-                    title = cached.get('ch_name', title)
-                    img = cached.get('img_url') or img
-                    year = cached.get('mal_year')
-                    status = "Cache Hit"
+        fetcher = MalAnalyticsFetcher()
+        for i, item in enumerate(q):
+            mal_id = item['mal_id']
+            title = item['mal_title']
+
+            img = 'https://cdn.myanimelist.net/img/sp/icon/apple-touch-icon-256.png'
+            year = None
+            status = "MAL Import"
+            is_low = False
+
+            if mal_id in id_cache:
+                cached = id_cache[mal_id]
+                title = cached.get('ch_name', title)
+                img = cached.get('img_url') or img
+                year = cached.get('mal_year')
+                status = "Cache Hit"
+            else:
+                details = fetcher.fetch_details(mal_id)
+                if details:
+                    img = details.get('img_url') or img
+                    year = details.get('year')
+                    status = "API Fetched"
                 else:
-                    time.sleep(0.4) 
-                    try:
-                        resp = req_session.get(f"https://api.jikan.moe/v4/anime/{mal_id}", timeout=10)
-                        if resp.status_code == 429:
-                            time.sleep(1.5)
-                            resp = req_session.get(f"https://api.jikan.moe/v4/anime/{mal_id}", timeout=10)
-                            
-                        if resp.status_code == 200:
-                            data = resp.json().get('data', {})
-                            img = data.get('images', {}).get('jpg', {}).get('image_url', img)
-                            aired_from = data.get('aired', {}).get('from')
-                            if aired_from and len(aired_from) >= 4 and aired_from[:4].isdigit():
-                                year = int(aired_from[:4])
-                            status = "API Fetched"
-                    except Exception:
-                        status = "API Failed"
-                
-                row = {
-                    'id': i,
-                    'baha_title': title,
-                    'mal_title': title,
-                    'mal_id': mal_id,
-                    'status': status,
-                    'img_url': img,
-                    'is_low': is_low,
-                    'year': year
-                }
-                results.append(row)
-                
-                yield f"data: {json.dumps({'type': 'image', 'img_url': img, 'title': title, 'status': status, 'is_low': is_low, 'current': i+1, 'total': total})}\n\n"
+                    status = "API Failed"
+
+            row = {
+                'id': i,
+                'baha_title': title,
+                'mal_title': title,
+                'mal_id': mal_id,
+                'status': status,
+                'img_url': img,
+                'is_low': is_low,
+                'year': year
+            }
+            results.append(row)
             
+            yield {'type': 'image', 'img_url': img, 'title': title, 'status': status, 'is_low': is_low, 'current': i+1, 'total': total}
+        
         TEMP_RESULTS[sid] = results
-        yield f"data: {json.dumps({'done': True})}\n\n"
-        yield ": keep-alive\n\n"
+        yield {'done': True}
 
-    return Response(generate(), mimetype='text/event-stream')
+    return job_stream(sid, 'mal-import', {}, generate)
@@ -1,8 +1,9 @@
 import os
 import json
-from flask import Blueprint, request, session, Response, send_file, current_app, after_this_request
+from flask import Blueprint, request, session, jsonify, Response, send_file, current_app, after_this_request, stream_with_context
 
 from core_logic import ThemeDownloader
+from jobs import job_stream
 from state import MUSIC_QUEUE
 
 music_bp = Blueprint('music', __name__)
@@ -22,13 +23,44 @@ def stream_music_download():
         dl = ThemeDownloader(max_workers=3) 
         try:
             output_path = os.path.join(output_folder, f"{user_id}_anime_songs.zip")
-            for st in dl.download_and_zip_generator(q, output_path):
-                yield f"data: {json.dumps(st)}\n\n"
+            yield from dl.download_and_zip_generator(q, output_path)
         except Exception as e:
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
-        yield ": keep-alive\n\n"
+            yield {'error': str(e)}
         
-    return Response(generate(), mimetype='text/event-stream')
+    return job_stream(sid, 'music', {'user_id': user_id}, generate)
+
+@music_bp.route('/stream/music-check')
+def stream_music_check():
+    user_id = request.args.get('user_id')
+    sid = request.args.get('sid') or session['uid']
+    q = MUSIC_QUEUE.get(sid)
+
+    if not q:
+        return Response("data: " + json.dumps({'error': 'Session expired or invalid queue.'}) + "\n\n", mimetype='text/event-stream')
+
+    def generate():
+        yield from ThemeDownloader().check_tracks_generator(q)
+
+    return job_stream(sid, 'music-check', {'user_id': user_id}, generate)
+
+@music_bp.route('/download/music-zip')
+def stream_music_zip():
+    user_id = request.args.get('user_id')
+    sid = request.args.get('sid') or session['uid']
+    q = MUSIC_QUEUE.get(sid)
+
+    if not q:
+        return jsonify({'ok': False, 'error': 'Session expired or invalid queue.'}), 404
+
+    dl = ThemeDownloader(max_workers=3)
+    return Response(
+        stream_with_context(dl.stream_zip_generator(q)),
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': f'attachment; filename="{user_id}_anime_songs.zip"',
+            'X-Accel-Buffering': 'no'
+        }
+    )
 
 @music_bp.route('/download/<path:filename>')
 def download_file(filename):
@@ -1,7 +1,7 @@
 import datetime
 from flask import Blueprint, request, session, jsonify
 
-from core_logic import MalXmlGenerator
+from jobs import supersede_jobs
 from services.sheets_service import append_to_sheet
 from state import TEMP_RESULTS, USER_SELECTIONS, FINAL_RESULTS, MUSIC_QUEUE, GAME_QUEUE, ANALYTICS_QUEUE
 
@@ -43,18 +43,19 @@ def dispatch_action():
         except: continue
     
     if action == 'xml':
-        gen = MalXmlGenerator()
         xml_data = [{'mal_id': i['mal_id'], 'title': i['mal_title']} for i in final]
-        FINAL_RESULTS[sid] = gen.generate_xml(xml_data, user_id)
+        FINAL_RESULTS[sid] = {'user_id': user_id, 'items': xml_data}
         return jsonify({'ok': True, 'action': 'xml', 'user_id': user_id})
         
     elif action == 'music':
         MUSIC_QUEUE[sid] = [{'mal_id': i['mal_id'], 'title': i['baha_title']} for i in final]
+        supersede_jobs(sid, 'music', 'music-check')
         return jsonify({'ok': True, 'action': 'music', 'user_id': user_id})
         
     elif action == 'guess':
         q = [{'mal_id': i['mal_id'], 'title': i['baha_title'], 'img_url': i['img_url'], 'year': i.get('year')} for i in final]
         GAME_QUEUE[sid] = q
+        supersede_jobs(sid, 'guess-playlist')
         valid_years = [int(i['year']) for i in q if i.get('year')]
         def_min = min(valid_years) if valid_years else 2000
         def_max = max(valid_years) if valid_years else datetime.datetime.now().year
@@ -72,6 +73,7 @@ def dispatch_action():
             {'mal_id': i['mal_id'], 'year': i.get('year'), 'baha_title': i['baha_title'], 'img_url': i['img_url']} 
             for i in final
         ]
+        supersede_jobs(sid, 'analytics')
         return jsonify({'ok': True, 'action': 'analytics', 'user_id': user_id})
         
     return jsonify({'ok': False, 'error': 'Unknown action'})
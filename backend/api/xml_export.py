@@ -1,10 +1,18 @@
-import io
-from flask import Blueprint, session, jsonify, send_file
+import zlib
+from flask import Blueprint, request, session, jsonify, Response, stream_with_context
 
+from core_logic import MalXmlGenerator
 from state import FINAL_RESULTS
 
 xml_export_bp = Blueprint('xml_export', __name__)
 
+def _gzip_chunks(chunks):
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = gz.compress(chunk.encode('utf-8'))
+        if data: yield data
+    yield gz.flush()
+
 @xml_export_bp.route('/xml-status/<user_id>')
 def xml_status(user_id):
     sid = session['uid']
@@ -14,14 +22,18 @@ def xml_status(user_id):
 @xml_export_bp.route('/download/xml/<user_id>')
 def download_xml(user_id):
     sid = session['uid']
-    content = FINAL_RESULTS.get(sid)
-    if not content: return "Invalid Request", 404
-    
-    mem = io.BytesIO()
-    if isinstance(content, str):
-        mem.write(content.encode('utf-8'))
+    selection = FINAL_RESULTS.get(sid)
+    if not selection: return "Invalid Request", 404
+
+    # Only the selection is kept in session state; the XML is written as it streams
+    chunks = MalXmlGenerator().iter_xml(selection['items'], selection['user_id'])
+    if request.args.get('gzip') == '1':
+        body, name, mimetype = _gzip_chunks(chunks), f"{user_id}_mal_import.xml.gz", 'application/gzip'
     else:
-        mem.write(content)
-        
-    mem.seek(0)
-    return send_file(mem, as_attachment=True, download_name=f"{user_id}_mal_import.xml", mimetype='application/xml')
+        body, name, mimetype = (c.encode('utf-8') for c in chunks), f"{user_id}_mal_import.xml", 'application/xml'
+
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{name}"'}
+    )
@@ -9,4 +9,64 @@ class Config:
     CANDIDATE_SHEET_NAME = 'Cache_Candidates'
     DEBUG_SHEET_NAME = 'Low_Confidence_Debug'
     CREDENTIALS_FILE = 'credentials.json'
-    CACHE_CSV_FILE = 'mal_id.csv'
\ No newline at end of file
+    CACHE_CSV_FILE = 'mal_id.csv'
+    # Compacted mapping built by update_cache.py; used instead of the CSV when present
+    MAPPING_DB = os.environ.get('MAPPING_DB', 'mal_id.db')
+    CACHE_DB = os.environ.get('CACHE_DB', 'cache.db')
+    LEGACY_THEME_CACHE_FILE = 'theme_cache.json'
+    # Jikan allows ~60 req/min and 3 req/s; shared by every caller in the process
+    JIKAN_RATE_PER_SEC = float(os.environ.get('JIKAN_RATE_PER_SEC', '1'))
+    JIKAN_BURST = int(os.environ.get('JIKAN_BURST', '3'))
+    JIKAN_MAX_RETRIES = int(os.environ.get('JIKAN_MAX_RETRIES', '3'))
+    # Concurrent MAL lookups per /api/stream/progress request
+    MATCH_WORKERS = int(os.environ.get('MATCH_WORKERS', '4'))
+    # MAL ids per animethemes.moe request (results are paginated server-side)
+    THEME_BATCH_SIZE = int(os.environ.get('THEME_BATCH_SIZE', '25'))
+    # animethemes.moe allows 90 req/min; shared by every theme lookup in the process
+    ANIMETHEMES_RATE_PER_SEC = float(os.environ.get('ANIMETHEMES_RATE_PER_SEC', '1.5'))
+    ANIMETHEMES_BURST = int(os.environ.get('ANIMETHEMES_BURST', '5'))
+    # Bahamut collection crawl: parallel page fetches and per-request timeout (s)
+    CRAWL_WORKERS = int(os.environ.get('CRAWL_WORKERS', '6'))
+    CRAWL_TIMEOUT = int(os.environ.get('CRAWL_TIMEOUT', '15'))
+    # Seconds before the persisted guess-game review index is refreshed
+    REVIEW_INDEX_TTL = int(os.environ.get('REVIEW_INDEX_TTL', str(6 * 3600)))
+    # Session state: sliding TTL per entry (s) and shared memory budget (bytes)
+    SESSION_TTL = int(os.environ.get('SESSION_TTL', str(2 * 3600)))
+    SESSION_STATE_MAX_BYTES = int(os.environ.get('SESSION_STATE_MAX_BYTES', str(256 * 1024 * 1024)))
+    # 'memory' keeps session state in-process; 'sqlite' shares it between
+    # worker processes on one host (e.g. gunicorn -w 4 app:app)
+    STATE_BACKEND = os.environ.get('STATE_BACKEND', 'memory')
+    STATE_DB = os.environ.get('STATE_DB', 'state.db')
+    # Seconds a cached Jikan /anime/{id} record is served before refetching
+    JIKAN_DETAIL_TTL = int(os.environ.get('JIKAN_DETAIL_TTL', str(7 * 24 * 3600)))
+    # Minimum trigram similarity for resolving a title from the local index
+    TITLE_INDEX_THRESHOLD = float(os.environ.get('TITLE_INDEX_THRESHOLD', '0.9'))
+    # Jikan search result cache: TTL for hits / for "no results", and max rows kept
+    JIKAN_SEARCH_TTL = int(os.environ.get('JIKAN_SEARCH_TTL', str(30 * 24 * 3600)))
+    JIKAN_SEARCH_NEGATIVE_TTL = int(os.environ.get('JIKAN_SEARCH_NEGATIVE_TTL', str(3 * 24 * 3600)))
+    JIKAN_SEARCH_MAX_ENTRIES = int(os.environ.get('JIKAN_SEARCH_MAX_ENTRIES', '50000'))
+    # Async fetch engine: concurrent requests per upstream host and overall
+    FETCH_PER_HOST = int(os.environ.get('FETCH_PER_HOST', '8'))
+    FETCH_MAX_INFLIGHT = int(os.environ.get('FETCH_MAX_INFLIGHT', '256'))
+    # Shared threads for blocking (cloudscraper) retries of failed engine requests, and how
+    # long (s) a host whose requests only succeed that way skips the engine
+    FETCH_FALLBACK_WORKERS = int(os.environ.get('FETCH_FALLBACK_WORKERS', '6'))
+    FETCH_FALLBACK_TTL = int(os.environ.get('FETCH_FALLBACK_TTL', '600'))
+    # Retries (with Range resume and backoff) per audio track download
+    DOWNLOAD_RETRIES = int(os.environ.get('DOWNLOAD_RETRIES', '4'))
+    # Shared on-disk cache of downloaded theme audio and its size budget (bytes)
+    AUDIO_CACHE_DIR = os.environ.get('AUDIO_CACHE_DIR', 'audio_cache')
+    AUDIO_CACHE_MAX_BYTES = int(os.environ.get('AUDIO_CACHE_MAX_BYTES', str(5 * 1024 ** 3)))
+    # Largest MAL export accepted for import, measured after gzip decompression (bytes)
+    MAL_IMPORT_MAX_BYTES = int(os.environ.get('MAL_IMPORT_MAX_BYTES', str(64 * 1024 * 1024)))
+    # Background jobs behind the SSE endpoints: worker threads, and how long (s)
+    # a finished job's event log stays available for reconnects
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '8'))
+    JOB_TTL = int(os.environ.get('JOB_TTL', str(2 * 3600)))
+    # Owners of unfinished jobs bump them every JOB_HEARTBEAT s (SQLite backend);
+    # one silent for JOB_STALE_AFTER s, or whose process is gone, is treated as dead
+    JOB_HEARTBEAT = int(os.environ.get('JOB_HEARTBEAT', '10'))
+    JOB_STALE_AFTER = int(os.environ.get('JOB_STALE_AFTER', '60'))
+    # sync.py bulk mode: resume file and how often (s) it is rewritten
+    SYNC_CHECKPOINT_FILE = os.environ.get('SYNC_CHECKPOINT_FILE', 'sync_checkpoint.json')
+    SYNC_CHECKPOINT_INTERVAL = int(os.environ.get('SYNC_CHECKPOINT_INTERVAL', '10'))
@@ -1,3 +1,6 @@
+import gzip
+import hashlib
+import io
 import requests
 import time
 import unicodedata
@@ -9,12 +12,26 @@ import tempfile
 import json
 import threading
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from zipfile import ZipFile, ZIP_DEFLATED
+from functools import partial
+from types import MappingProxyType
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from zipfile import ZipFile, ZipInfo, ZIP_STORED
 import cloudscraper
 import xml.etree.ElementTree as ET
-from xml.dom import minidom
+from xml.sax.saxutils import escape
 from config import Config
+from fetch_engine import FetchEngine
+from mapping_store import MappingStore, normalize_row
+from ratelimit import ANIMETHEMES_LIMITER, JIKAN_LIMITER, limited_get
+from storage import SqliteKV
+
+def scraper_get_json(rq, req):
+    """FetchEngine fallback: GET an engine request through a cloudscraper session, as (status, json)."""
+    try:
+        resp = rq.get(req['url'], params=req.get('params'), timeout=req.get('timeout', 20))
+        return resp.status_code, (resp.json() if resp.status_code == 200 else None)
+    except Exception:
+        return None, None
 
 class ThemeCacheManager:
     _instance = None
@@ -28,87 +45,166 @@ class ThemeCacheManager:
             return cls._instance
 
     def _init_cache(self):
-        self.cache_file = 'theme_cache.json'
-        self.cache = {}
-        self.file_lock = threading.Lock()
+        self.cache = SqliteKV(Config.CACHE_DB, 'themes')
         self.rq = cloudscraper.create_scraper()
         self.rq.headers.update({'User-Agent': 'Mozilla/5.0'})
         self.search_url = "https://api.animethemes.moe/anime"
-        self.load_cache()
+        self.inflight = {}
+        self.inflight_lock = threading.Lock()
+        self.counters = {'hits': 0, 'issued': 0, 'coalesced': 0, 'requests': 0, 'throttled': 0}
+        self.import_legacy_cache()
 
-    def load_cache(self):
-        if os.path.exists(self.cache_file):
-            try:
-                with open(self.cache_file, 'r', encoding='utf-8') as f:
-                    self.cache = json.load(f)
-            except:
-                self.cache = {}
+    def import_legacy_cache(self):
+        # One-time migration of the old theme_cache.json into the SQLite store
+        if len(self.cache) or not os.path.exists(Config.LEGACY_THEME_CACHE_FILE):
+            return
+        try:
+            with open(Config.LEGACY_THEME_CACHE_FILE, 'r', encoding='utf-8') as f:
+                self.cache.put_many(json.load(f))
+        except Exception:
+            pass
 
-    def save_cache(self):
-        with self.file_lock:
-            try:
-                with open(self.cache_file, 'w', encoding='utf-8') as f:
-                    json.dump(self.cache, f, ensure_ascii=False, indent=4)
-            except:
-                pass
+    def get_themes(self, mal_id):
+        return self.get_themes_many([mal_id])[str(mal_id)]
 
-    def get_themes(self, mal_id, retry=0):
-        mal_id_str = str(mal_id)
-        
-        if mal_id_str in self.cache:
-            return self.cache[mal_id_str]
+    def get_themes_many(self, mal_ids, batch_size=None):
+        keys = list(dict.fromkeys(str(i) for i in mal_ids))
+        result = self.cache.get_many(keys)
+        misses = [k for k in keys if k not in result]
+
+        # Single-flight: claim ids nobody is fetching, wait on the others
+        owned, waiting = {}, {}
+        with self.inflight_lock:
+            self.counters['hits'] += len(keys) - len(misses)
+            for k in misses:
+                if k in self.inflight:
+                    waiting[k] = self.inflight[k]
+                else:
+                    owned[k] = self.inflight[k] = Future()
+            self.counters['coalesced'] += len(waiting)
+            self.counters['issued'] += len(owned)
 
-        themes = []
         try:
-            params = {
+            # Another caller may have stored these between our read and the claim
+            result.update(self.cache.get_many(owned))
+            todo = [k for k in owned if k not in result]
+            size = batch_size or Config.THEME_BATCH_SIZE
+            batches = [todo[i:i + size] for i in range(0, len(todo), size)]
+            for fetched in self._fetch_batches(batches):
+                if fetched is None: continue
+                self.cache.put_many(fetched)
+                result.update(fetched)
+        finally:
+            with self.inflight_lock:
+                for k, fut in owned.items():
+                    del self.inflight[k]
+                    fut.set_result(result.get(k))
+
+        for k, fut in waiting.items():
+            themes = fut.result()
+            if themes is not None:
+                result[k] = themes
+
+        return {k: result.get(k, []) for k in keys}
+
+    def stats(self):
+        with self.inflight_lock:
+            return dict(self.counters, inflight=len(self.inflight))
+
+    def _fetch_batches(self, batches):
+        # All batches go through the async engine together, one round per page;
+        # a None result means "don't cache, try later"
+        found = [{} for _ in batches]
+        failed = set()
+        pending = {}
+        for b, mal_ids in enumerate(batches):
+            pending[b] = {'url': self.search_url, 'params': {
                 "filter[has]": "resources",
                 "filter[site]": "MyAnimeList",
-                "filter[external_id]": mal_id,
-                "include": "animethemes.song,animethemes.animethemeentries.videos.audio"
-            }
-            resp = self.rq.get(self.search_url, params=params, timeout=10)
+                "filter[external_id]": ",".join(mal_ids),
+                "include": "resources,animethemes.song,animethemes.animethemeentries.videos.audio",
+                "page[size]": 100
+            }, 'headers': {'User-Agent': 'Mozilla/5.0'}, 'timeout': 20}
 
-            if resp.status_code == 429:
-                if retry >= 3: return []
-                time.sleep(2 * (retry + 1))
-                return self.get_themes(mal_id, retry + 1)
+        retry = 0
+        while pending:
+            order = list(pending)
+            with self.inflight_lock:
+                self.counters['requests'] += len(order)
+            for _ in order:
+                ANIMETHEMES_LIMITER.acquire()
+            responses = FetchEngine().get_json_many([pending[b] for b in order], fallback=self._scraper_get)
 
-            if resp.status_code == 200:
-                data = resp.json().get('anime', [])
-                if data:
-                    for t in data[0].get('animethemes', []):
-                        try:
-                            slug = t.get('slug', 'Unknown')
-                            song_data = t.get('song')
-                            title = song_data.get('title', 'Unknown Title') if song_data else 'Unknown Title'
-
-                            entries = t.get('animethemeentries', [])
-                            if not entries: continue
-
-                            videos = entries[0].get('videos', [])
-                            if not videos: continue
-
-                            video = videos[0]
-                            link = ""
-
-                            audio = video.get('audio')
-                            if audio and isinstance(audio, dict) and audio.get('link'):
-                                link = audio.get('link')
-                            else:
-                                v_link = video.get('link', '')
-                                if v_link:
-                                    link = v_link.replace('//v.animethemes.moe/', '//a.animethemes.moe/').replace('.webm', '.ogg')
-
-                            if link:
-                                themes.append({'type': slug, 'title': title, 'link': link})
-                        except Exception:
-                            continue
-
-            self.cache[mal_id_str] = themes
-            self.save_cache()
-            return themes
-        except Exception:
-            return []
+            throttled = 0
+            for b, (status, body) in zip(order, responses):
+                if status == 429:
+                    throttled += 1
+                    continue
+                req = pending.pop(b)
+                if status != 200 or body is None:
+                    failed.add(b)
+                    continue
+                wanted = set(batches[b])
+                for anime in body.get('anime', []):
+                    for res in anime.get('resources', []):
+                        mid = str(res.get('external_id'))
+                        if res.get('site') == 'MyAnimeList' and mid in wanted and mid not in found[b]:
+                            found[b][mid] = self._parse_themes(anime)
+
+                # The next link already carries every query parameter
+                next_url = (body.get('links') or {}).get('next')
+                if next_url:
+                    pending[b] = dict(req, url=next_url, params=None)
+
+            if throttled:
+                with self.inflight_lock:
+                    self.counters['throttled'] += throttled
+                if retry >= 3:
+                    failed.update(pending)
+                    with ANIMETHEMES_LIMITER.lock:
+                        ANIMETHEMES_LIMITER.gave_up += 1
+                    break
+                # Pauses every caller sharing the limiter, not just this batch
+                ANIMETHEMES_LIMITER.backoff(2 * (retry + 1))
+                retry += 1
+
+        return [None if b in failed else {mid: found[b].get(mid, []) for mid in mal_ids}
+                for b, mal_ids in enumerate(batches)]
+
+    def _scraper_get(self, req):
+        ANIMETHEMES_LIMITER.acquire()
+        return scraper_get_json(self.rq, req)
+
+    def _parse_themes(self, anime):
+        themes = []
+        for t in anime.get('animethemes', []):
+            try:
+                slug = t.get('slug', 'Unknown')
+                song_data = t.get('song')
+                title = song_data.get('title', 'Unknown Title') if song_data else 'Unknown Title'
+
+                entries = t.get('animethemeentries', [])
+                if not entries: continue
+
+                videos = entries[0].get('videos', [])
+                if not videos: continue
+
+                video = videos[0]
+                link = ""
+
+                audio = video.get('audio')
+                if audio and isinstance(audio, dict) and audio.get('link'):
+                    link = audio.get('link')
+                else:
+                    v_link = video.get('link', '')
+                    if v_link:
+                        link = v_link.replace('//v.animethemes.moe/', '//a.animethemes.moe/').replace('.webm', '.ogg')
+
+                if link:
+                    themes.append({'type': slug, 'title': title, 'link': link})
+            except Exception:
+                continue
+        return themes
 
 
 class BahamutCrawler:
@@ -121,48 +217,87 @@ class BahamutCrawler:
         self.collection_api = "https://wall.gamer.com.tw/api/user_join_fanpage.php?"
         self.detail_api = "https://api.gamer.com.tw/acg/v1/acg_list.php"
 
-    def get_collections(self):
+    def _fetch_collection_page(self, star, page):
+        params = {'userid': self.user_id, 'kind': f'S{star}', 'page': page, 'category': 4}
+        response = self.rq.get(self.collection_api, params=params, timeout=Config.CRAWL_TIMEOUT).json()
+        return response.get('data') or {}
+
+    def collections_generator(self):
+        # First page of every star kind in parallel, then the remaining pages
+        pages = {}
+        failed = 0
+        ex = ThreadPoolExecutor(max_workers=Config.CRAWL_WORKERS)
+        try:
+            first = {ex.submit(self._fetch_collection_page, star, 1): (star, 1) for star in range(0, 6)}
+            rest = {}
+            for f in as_completed(first):
+                star, page = first[f]
+                try:
+                    data = f.result()
+                except Exception:
+                    failed += 1
+                    continue
+                pages[(star, page)] = data.get('list', [])
+                for p in range(2, data.get('tpage', 1) + 1):
+                    rest[ex.submit(self._fetch_collection_page, star, p)] = (star, p)
+
+            total = len(first) + len(rest)
+            done = len(first)
+            yield {'msg': f'Collection index: {total} pages queued.', 'current': done, 'total': total}
+            for f in as_completed(rest):
+                done += 1
+                try:
+                    pages[rest[f]] = f.result().get('list', [])
+                except Exception:
+                    failed += 1
+                yield {'msg': f'Collection pages [{done}/{total}]', 'current': done, 'total': total}
+        finally:
+            ex.shutdown(wait=False, cancel_futures=True)
+
+        if failed:
+            yield {'msg': f'WARN: {failed} collection pages failed, results may be partial.', 'failed': failed}
+
         acg_list = []
-        for star in range(0, 6):
-            params = {'userid': self.user_id, 'kind': f'S{star}', 'page': 1, 'category': 4}
+        for key in sorted(pages):
+            for e in pages[key]: acg_list.append({'ch_name': e['name'], 'id': e['id']})
+        yield {'done': True, 'collections': list({v['id']: v for v in acg_list}.values()), 'failed': failed}
+
+    def get_collections(self):
+        for st in self.collections_generator():
+            if st.get('done'):
+                return st['collections']
+        return []
+
+    def fetch_review_page(self, target_user, page):
+        # None once the listing runs out of pages
+        review_api = "https://api.gamer.com.tw/acg/v1/reviews_user.php"
+        params = {'userId': target_user, 'page': page}
+        data = self.rq.get(review_api, params=params, timeout=Config.CRAWL_TIMEOUT).json().get('data', {})
+        if data.get('page', 0) == 0:
+            return None
+        reviews = {}
+        for e in data.get('list', []):
             try:
-                response = self.rq.get(self.collection_api, params=params).json()
-                if 'data' not in response: continue
-                data = response['data']
-                if 'list' in data:
-                    for e in data['list']: acg_list.append({'ch_name': e['name'], 'id': e['id']})
-                for page in range(2, data.get('tpage', 1) + 1):
-                    params['page'] = page
-                    f = self.rq.get(self.collection_api, params=params).json()['data']
-                    for e in f['list']: acg_list.append({'ch_name': e['name'], 'id': e['id']})
-            except: pass
-        return list({v['id']: v for v in acg_list}.values())
+                reviews[e[0]['reviews']['name']] = e[0]['content']
+            except (KeyError, IndexError):
+                continue
+        return reviews
 
     def get_reviews(self, target_user="sses3205"):
-        review_api = "https://api.gamer.com.tw/acg/v1/reviews_user.php"
         reviews_dict = {}
         for page in range(1, 10000):
-            params = {'userId': target_user, 'page': page}
             try:
-                response = self.rq.get(review_api, params=params).json()
-                data = response.get('data', {})
-                if data.get('page', 0) == 0:
-                    break
-                for e in data.get('list', []):
-                    try:
-                        ch_name = e[0]['reviews']['name']
-                        content = e[0]['content']
-                        reviews_dict[ch_name] = content
-                    except (KeyError, IndexError):
-                        continue
+                reviews = self.fetch_review_page(target_user, page)
             except Exception:
                 break
+            if reviews is None:
+                break
+            reviews_dict.update(reviews)
         return reviews_dict
 
-    def get_detail(self, sn_id):
+    def _parse_detail(self, payload):
         try:
-            data = self.rq.get(self.detail_api, params={'sn': sn_id}).json()['data']['acg']['all'].items()
-            for sn, info in data:
+            for sn, info in payload['data']['acg']['all'].items():
                 det = info.get('detailed', {})
                 if det.get('platform', {}).get('value') == '動畫':
                     time_val = det.get('localDebut', {}).get('value')
@@ -177,39 +312,315 @@ class BahamutCrawler:
         except: pass
         return None
 
+    def _fetch_detail_body(self, sn_id):
+        try:
+            return self.rq.get(self.detail_api, params={'sn': sn_id}, timeout=Config.CRAWL_TIMEOUT).json()
+        except: return None
+
+    def get_detail(self, sn_id):
+        body = self._fetch_detail_body(sn_id)
+        return self._parse_detail(body) if body else None
+
     def fetch_all_details(self, simple_list):
-        with ThreadPoolExecutor(max_workers=8) as executor:
-            results = list(executor.map(self.get_detail, [e['id'] for e in simple_list]))
+        """Details for every entry, in order; `detail_failures` counts the ones that could not be fetched."""
+        headers = {'User-Agent': self.rq.headers['User-Agent']}
+        reqs = [{'url': self.detail_api, 'params': {'sn': e['id']}, 'headers': headers, 'timeout': Config.CRAWL_TIMEOUT}
+                for e in simple_list]
+        bodies = [body for status, body in FetchEngine().get_json_many(reqs, fallback=partial(scraper_get_json, self.rq))]
+
+        self.detail_failures = sum(1 for body in bodies if body is None)
+        results = [self._parse_detail(body) for body in bodies if body]
         return [r for r in results if r]
 
 
+class ReviewIndex:
+    """Persisted per-reviewer review index.
+
+    The reviews listing is newest-first, so once an index is complete a
+    refresh only walks pages until one brings nothing new. A first build
+    stores its progress every SAVE_EVERY pages, and an incomplete index is
+    resumed in the background after the last page it stored.
+    """
+    SAVE_EVERY = 10
+    _refreshing = set()
+    _lock = threading.Lock()
+    _released = threading.Condition(_lock)
+
+    def __init__(self):
+        self.store = SqliteKV(Config.CACHE_DB, 'reviews')
+
+    def _claim(self, reviewer):
+        with self._lock:
+            if reviewer in self._refreshing:
+                return False
+            self._refreshing.add(reviewer)
+            return True
+
+    def _release(self, reviewer):
+        with self._lock:
+            self._refreshing.discard(reviewer)
+            self._released.notify_all()
+
+    def get(self, reviewer):
+        entry = self.store.get(reviewer)
+        if entry is None:
+            if self._claim(reviewer):
+                try:
+                    return self.refresh(reviewer)['reviews']
+                finally:
+                    self._release(reviewer)
+            # Another request is already building it; wait instead of crawling twice
+            with self._lock:
+                while reviewer in self._refreshing:
+                    self._released.wait()
+            entry = self.store.get(reviewer)
+            return entry['reviews'] if entry else {}
+        if not entry['complete'] or time.time() - entry['fetched_at'] > Config.REVIEW_INDEX_TTL:
+            # Serve what is stored now, resume or refresh it in the background
+            if self._claim(reviewer):
+                threading.Thread(target=self._background_refresh, args=(reviewer,), daemon=True).start()
+        return entry['reviews']
+
+    def _background_refresh(self, reviewer):
+        try:
+            self.refresh(reviewer)
+        finally:
+            self._release(reviewer)
+
+    def refresh(self, reviewer):
+        entry = self.store.get(reviewer) or {'reviews': {}, 'pages': 0, 'complete': False}
+        reviews = entry['reviews']
+        crawler = BahamutCrawler(reviewer)
+        page = 1 if entry['complete'] else entry['pages'] + 1
+
+        while page < 10000:
+            try:
+                found = crawler.fetch_review_page(reviewer, page)
+            except Exception:
+                break
+            if found is None:
+                entry['complete'] = True
+                break
+            fresh = {k: v for k, v in found.items() if reviews.get(k) != v}
+            reviews.update(fresh)
+            entry['pages'] = max(entry['pages'], page)
+            if entry['complete'] and not fresh:
+                break
+            if page % self.SAVE_EVERY == 0:
+                entry['fetched_at'] = time.time()
+                self.store.put(reviewer, entry)
+            page += 1
+
+        entry['reviews'] = reviews
+        entry['fetched_at'] = time.time()
+        self.store.put(reviewer, entry)
+        return entry
+
+
+class MappingIndex:
+    """Immutable snapshot of the ch_name -> MAL mapping, indexed both ways."""
+
+    def __init__(self, by_name, by_id, mtime):
+        self.by_name = MappingProxyType(by_name)
+        self.by_id = MappingProxyType(by_id)
+        self.mtime = mtime
+
+    @classmethod
+    def load(cls, path, mtime):
+        by_name, by_id = {}, {}
+        try:
+            if path.endswith('.db'):
+                store = MappingStore(path)
+                try: rows = store.rows()
+                finally: store.close()
+            else:
+                with open(path, mode='r', encoding='utf-8-sig') as f:
+                    rows = [r for r in map(normalize_row, csv.DictReader(f)) if r]
+            for row in rows:
+                entry = dict(row, mal_title=row['mal_title'] or row['ch_name'])
+                by_name[entry['ch_name']] = entry
+                by_id.setdefault(entry['mal_id'], entry)
+        except Exception: pass
+        return cls(by_name, by_id, mtime)
+
+
+_mapping_indexes = {}
+_mapping_lock = threading.Lock()
+
+
+def get_mapping_index(path=Config.CACHE_CSV_FILE):
+    """Process-wide mapping index; reloaded and swapped when the file's mtime changes."""
+    # The compacted DB built by update_cache.py supersedes the CSV
+    if path == Config.CACHE_CSV_FILE and os.path.exists(Config.MAPPING_DB):
+        path = Config.MAPPING_DB
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        mtime = None
+    index = _mapping_indexes.get(path)
+    if index is not None and index.mtime == mtime:
+        return index
+    with _mapping_lock:
+        index = _mapping_indexes.get(path)
+        if index is None or index.mtime != mtime:
+            index = MappingIndex.load(path, mtime)
+            _mapping_indexes[path] = index
+    return index
+
+
+class TitleIndex:
+    """Trigram index over known MAL titles for resolving names without Jikan.
+
+    Built from the mapping index plus titles learned from confident Jikan
+    matches. A lookup only counts as a hit when the best match clears
+    Config.TITLE_INDEX_THRESHOLD, carries the same season/number markers and
+    no other MAL id scores close to it.
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(TitleIndex, cls).__new__(cls)
+                cls._instance._init_index()
+            return cls._instance
+
+    def _init_index(self):
+        self.learned = SqliteKV(Config.CACHE_DB, 'titles')
+        self.index_lock = threading.Lock()
+        self.mapping = None
+        self.counters = {'lookups': 0, 'hits': 0}
+
+    @staticmethod
+    def normalize(text):
+        if not text: return ''
+        text = unicodedata.normalize("NFKC", str(text)).replace('劇場版', '').lower()
+        return re.sub(r'[\W_]+', '', text)
+
+    @staticmethod
+    def markers(text):
+        """Everything that tells a sequel, movie or spin-off apart from its base title.
+
+        normalize() drops punctuation and 劇場版, so these are compared separately:
+        numbers, "!!"/"??" runs, movie tags, and a short leading or trailing
+        segment such as the W in "美少女邪神 W" or the WWW in "WWW.WORKING!!".
+        """
+        text = unicodedata.normalize("NFKC", str(text or '')).lower()
+        marks = set(re.findall(r'\d+|[一二三四五六七八九十零〇]+|\b[ivx]+\b|[!?]{2,}', text))
+        if re.search(r'劇場|movie|the animation film', text):
+            marks.add('movie')
+        # Latin runs are split from CJK ones too, so a glued "邪神W" still has its W
+        segments = re.findall(r'[a-zα-ω]+|\d+|[^\W\da-zα-ω_]+', text)
+        if len(segments) > 1:
+            for pos, seg in (('head', segments[0]), ('tail', segments[-1])):
+                short = len(seg) <= 2 or (len(seg) <= 3 and seg.isascii())
+                if short and not re.search(r'^\d|[一二三四五六七八九十零〇]', seg):
+                    marks.add(f'{pos}:{seg}')
+        return frozenset(marks)
+
+    @staticmethod
+    def trigrams(norm):
+        if len(norm) < 3: return {norm}
+        return {norm[i:i + 3] for i in range(len(norm) - 2)}
+
+    def _add(self, title, entry):
+        norm = self.normalize(title)
+        if not norm: return
+        marks = self.markers(title)
+        # Titles that only differ by their markers (K-On! / K-On!!) stay separate
+        key = (norm, marks)
+        if key in self.by_norm: return
+        self.by_norm[key] = entry
+        for g in self.trigrams(norm):
+            self.postings.setdefault(g, set()).add(key)
+
+    def _ensure_built(self):
+        mapping = get_mapping_index()
+        if mapping is self.mapping: return
+        self.by_norm, self.postings = {}, {}
+        for c in mapping.by_name.values():
+            entry = {'mal_id': c['mal_id'], 'title': c['mal_title'], 'img_url': c.get('img_url'), 'mal_year': c.get('mal_year')}
+            self._add(c['ch_name'], entry)
+            self._add(c['mal_title'], entry)
+        for title, entry in self.learned.items():
+            self._add(entry.pop('source_title', title), entry)
+        self.mapping = mapping
+
+    def learn(self, titles, entry):
+        entry = {k: entry.get(k) for k in ('mal_id', 'title', 'img_url', 'mal_year')}
+        with self.index_lock:
+            self._ensure_built()
+            rows = {}
+            for t in titles:
+                norm = self.normalize(t)
+                if norm and (norm, self.markers(t)) not in self.by_norm:
+                    self._add(t, entry)
+                    rows[t] = dict(entry, source_title=t)
+            self.learned.put_many(rows)
+
+    def lookup(self, names):
+        with self.index_lock:
+            self._ensure_built()
+            self.counters['lookups'] += 1
+            best = {}
+            for name in names:
+                norm = self.normalize(name)
+                if not norm: continue
+                grams = self.trigrams(norm)
+                shared = {}
+                for g in grams:
+                    for cand in self.postings.get(g, ()):
+                        shared[cand] = shared.get(cand, 0) + 1
+                want = self.markers(name)
+                for (cand, marks), n in shared.items():
+                    if marks != want: continue
+                    entry = self.by_norm[(cand, marks)]
+                    score = 2 * n / (len(grams) + len(self.trigrams(cand)))
+                    if score > best.get(entry['mal_id'], (0, None))[0]:
+                        best[entry['mal_id']] = (score, entry)
+
+            ranked = sorted(best.values(), key=lambda x: -x[0])
+            if not ranked or ranked[0][0] < Config.TITLE_INDEX_THRESHOLD: return None
+            if len(ranked) > 1 and ranked[0][0] - ranked[1][0] < 0.1: return None
+            self.counters['hits'] += 1
+            return ranked[0][1]
+
+    def stats(self):
+        with self.index_lock:
+            lookups, hits = self.counters['lookups'], self.counters['hits']
+            return {'lookups': lookups, 'hits': hits, 'hit_rate': round(hits / lookups, 3) if lookups else 0}
+
+
 class MalMatcher:
+    search_counters = {'hits': 0, 'misses': 0}
+    _stats_lock = threading.Lock()
+    _search_cache = None
+
     def __init__(self, cache_file=Config.CACHE_CSV_FILE):
         self.rq = cloudscraper.create_scraper()
         self.search_api = "https://api.jikan.moe/v4/anime"
         self.allowed_types = ['TV', 'MOVIE', 'OVA', 'TV SPECIAL', 'ONA', 'SPECIAL']
-        self.cache = {}
         self.cache_file = cache_file
         self.theme_mgr = ThemeCacheManager()
+        self.title_index = TitleIndex()
+        self.search_cache = self._shared_search_cache()
         self.load_cache()
 
+    @classmethod
+    def _shared_search_cache(cls):
+        # One store per process: its write counter drives pruning, and matchers are per-request
+        with cls._stats_lock:
+            if cls._search_cache is None:
+                cls._search_cache = SqliteKV(
+                    Config.CACHE_DB, 'jikan_search',
+                    ttl=Config.JIKAN_SEARCH_TTL, max_entries=Config.JIKAN_SEARCH_MAX_ENTRIES
+                )
+            return cls._search_cache
+
     def load_cache(self):
-        if os.path.exists(self.cache_file):
-            try:
-                with open(self.cache_file, mode='r', encoding='utf-8-sig') as f:
-                    reader = csv.DictReader(f)
-                    for row in reader:
-                        if row.get('ch_name') and row.get('mal_id'):
-                            mal_title = row.get('mal_title')
-                            if not mal_title: mal_title = row['ch_name']
-                            self.cache[row['ch_name'].strip()] = {
-                                'mal_id': int(row['mal_id']),
-                                'img_url': row.get('img_url', ''),
-                                'mal_title': mal_title,
-                                'mal_year': row.get('mal_year'),
-                                'ch_name': row['ch_name'].strip()
-                            }
-            except: pass
+        self.index = get_mapping_index(self.cache_file)
+        self.cache = self.index.by_name
 
     def clean_text(self, text):
         if not text: return None
@@ -217,17 +628,44 @@ class MalMatcher:
 
     def search_jikan(self, query):
         if not query: return []
+        key = ' '.join(query.lower().split())
+        cached = self.search_cache.get(key)
+        if cached is not None and (cached['data'] or time.time() - cached['at'] < Config.JIKAN_SEARCH_NEGATIVE_TTL):
+            with self._stats_lock:
+                MalMatcher.search_counters['hits'] += 1
+            return cached['data']
+
+        with self._stats_lock:
+            MalMatcher.search_counters['misses'] += 1
         try:
-            time.sleep(0.1) 
-            resp = self.rq.get(self.search_api, params={'q': query, 'limit': 5}, timeout=10)
-            if resp.status_code == 429:
-                time.sleep(0.5)
-                return self.search_jikan(query)
+            resp = limited_get(JIKAN_LIMITER, self.rq, self.search_api, params={'q': query, 'limit': 5}, timeout=10)
             if resp.status_code == 200:
-                return resp.json().get('data', [])
+                data = [self._slim_result(r) for r in resp.json().get('data', [])]
+                # Empty results are cached too, on a shorter TTL
+                self.search_cache.put(key, {'data': data, 'at': time.time()})
+                return data
         except: pass
         return []
 
+    def _slim_result(self, res):
+        # Only the fields resolve_mal_id reads, in the same shape Jikan returns them
+        return {
+            'mal_id': res.get('mal_id'),
+            'title': res.get('title'),
+            'title_english': res.get('title_english'),
+            'title_japanese': res.get('title_japanese'),
+            'type': res.get('type'),
+            'url': res.get('url'),
+            'aired': {'from': (res.get('aired') or {}).get('from')},
+            'images': {'jpg': {'image_url': (res.get('images') or {}).get('jpg', {}).get('image_url')}}
+        }
+
+    @classmethod
+    def search_stats(cls):
+        with cls._stats_lock:
+            hits, misses = cls.search_counters['hits'], cls.search_counters['misses']
+            return {'hits': hits, 'misses': misses, 'hit_rate': round(hits / (hits + misses), 3) if hits + misses else 0}
+
     def get_days_diff(self, api_date_str, target_date):
         if not target_date or not api_date_str: return 99999
         try:
@@ -249,6 +687,23 @@ class MalMatcher:
                 'mal_year': c.get('mal_year')
             }, "Cache Hit"
 
+        hit = self.title_index.lookup([ch_name, row.get('jp_name'), row.get('eng_name')])
+        if hit:
+            # Same bar as a Jikan winner: matching year and themes on animethemes
+            if not row.get('year') or str(hit.get('mal_year') or '') != str(row['year']):
+                status = "Low Confidence (Index, Year Mismatch)"
+            elif not self.theme_mgr.get_themes(hit['mal_id']):
+                status = "Low Confidence (Index, No Audio)"
+            else:
+                status = "Index Hit"
+            return {
+                'mal_id': hit['mal_id'],
+                'title': hit['title'],
+                'url': f"https://myanimelist.net/anime/{hit['mal_id']}",
+                'img_url': hit.get('img_url') or 'https://cdn.myanimelist.net/img/sp/icon/apple-touch-icon-256.png',
+                'mal_year': hit.get('mal_year')
+            }, status
+
         target_date = None
         if row.get('year'):
             try: target_date = datetime(row['year'], row.get('month', 1), row.get('day', 1))
@@ -282,7 +737,8 @@ class MalMatcher:
                     'is_group_1': is_group_1,
                     'priority': priority, 
                     'idx': idx,
-                    'mal_year': mal_year
+                    'mal_year': mal_year,
+                    'alt_titles': [res.get('title_english'), res.get('title_japanese')]
                 })
 
         if not candidates:
@@ -302,6 +758,7 @@ class MalMatcher:
 
         if winner['is_group_1'] and has_themes:
             status = "High Confidence"
+            self.title_index.learn([ch_name, row.get('jp_name'), row.get('eng_name'), winner['title']] + winner['alt_titles'], winner)
         else:
             if not winner['is_group_1']:
                 status = f"Low Confidence (Diff {winner['diff']} days)"
@@ -312,31 +769,178 @@ class MalMatcher:
 
 
 class MalXmlGenerator:
-    def generate_xml(self, anime_data_list, user_id):
-        root = ET.Element("myanimelist")
-        info = ET.SubElement(root, "myinfo")
-        ET.SubElement(info, "user_id").text = str(user_id)
-        ET.SubElement(info, "user_name").text = str(user_id)
-        ET.SubElement(info, "user_export_type").text = "1"
+    """Writes the MAL import XML incrementally, in the layout minidom's toprettyxml produced."""
+    CHUNK_SIZE = 64 * 1024
 
+    @staticmethod
+    def _text(value):
+        return escape(str(value), {'"': '&quot;'})
+
+    def _anime(self, data):
+        return (
+            "    <anime>\n"
+            f"        <series_animedb_id>{self._text(data['mal_id'])}</series_animedb_id>\n"
+            f"        <series_title>{self._text(data.get('title', 'Unknown'))}</series_title>\n"
+            "        <my_status>Completed</my_status>\n"
+            "        <my_watched_episodes>0</my_watched_episodes>\n"
+            "        <my_start_date>0000-00-00</my_start_date>\n"
+            "        <my_finish_date>0000-00-00</my_finish_date>\n"
+            "        <my_score>0</my_score>\n"
+            "        <update_on_import>1</update_on_import>\n"
+            "    </anime>\n"
+        )
+
+    def iter_xml(self, anime_data_list, user_id):
+        uid = self._text(user_id)
+        buf = [
+            '<?xml version="1.0" ?>\n<myanimelist>\n    <myinfo>\n'
+            f"        <user_id>{uid}</user_id>\n"
+            f"        <user_name>{uid}</user_name>\n"
+            "        <user_export_type>1</user_export_type>\n    </myinfo>\n"
+        ]
+        size = len(buf[0])
         for data in anime_data_list:
-            anime = ET.SubElement(root, "anime")
-            ET.SubElement(anime, "series_animedb_id").text = str(data['mal_id'])
-            ET.SubElement(anime, "series_title").text = str(data.get('title', 'Unknown'))
-            ET.SubElement(anime, "my_status").text = "Completed"
-            ET.SubElement(anime, "my_watched_episodes").text = "0"
-            ET.SubElement(anime, "my_start_date").text = "0000-00-00"
-            ET.SubElement(anime, "my_finish_date").text = "0000-00-00"
-            ET.SubElement(anime, "my_score").text = "0"
-            ET.SubElement(anime, "update_on_import").text = "1"
+            part = self._anime(data)
+            buf.append(part)
+            size += len(part)
+            if size >= self.CHUNK_SIZE:
+                yield ''.join(buf)
+                buf, size = [], 0
+        buf.append("</myanimelist>\n")
+        yield ''.join(buf)
+
+    def generate_xml(self, anime_data_list, user_id):
+        return ''.join(self.iter_xml(anime_data_list, user_id))
+
+
+class AudioCache:
+    """Content-addressed disk cache of theme audio shared by every export.
+
+    Files are named by the SHA-1 of their link. A file's mtime is its last
+    use, and the least recently used files are evicted once the directory
+    grows past Config.AUDIO_CACHE_MAX_BYTES.
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(AudioCache, cls).__new__(cls)
+                cls._instance._init_cache()
+            return cls._instance
+
+    def _init_cache(self):
+        self.dir = Config.AUDIO_CACHE_DIR
+        self.max_bytes = Config.AUDIO_CACHE_MAX_BYTES
+        os.makedirs(self.dir, exist_ok=True)
+        self.stats_lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'evicted': 0}
+        self.warming = set()
+        self.bytes = sum(size for _, _, size in self._entries())
+
+    def _entries(self):
+        entries = []
+        with os.scandir(self.dir) as it:
+            for e in it:
+                if e.is_file() and not e.name.endswith('.part'):
+                    st = e.stat()
+                    entries.append((st.st_mtime, e.path, st.st_size))
+        return entries
+
+    def path_for(self, url):
+        ext = url.rsplit('.', 1)[-1] if '.' in url.rsplit('/', 1)[-1] else 'bin'
+        return os.path.join(self.dir, f"{hashlib.sha1(url.encode('utf-8')).hexdigest()}.{ext}")
+
+    def get(self, url):
+        path = self.path_for(url)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        with self.stats_lock:
+            self.counters['hits'] += 1
+        return path
+
+    def fetch(self, url, downloader):
+        """Return a local path for `url`, downloading it through `downloader` on a miss."""
+        path = self.get(url)
+        if path: return path
+        with self.stats_lock:
+            self.counters['misses'] += 1
+        path = self.path_for(url)
+        if not downloader._download_file(url, path):
+            return None
+        with self.stats_lock:
+            self.bytes += os.path.getsize(path)
+            over = self.bytes > self.max_bytes
+        if over: self._evict()
+        return path
+
+    def warm(self, url, downloader):
+        """Fetch `url` into the cache on a background thread, once per url."""
+        with self.stats_lock:
+            if url in self.warming or os.path.exists(self.path_for(url)): return
+            self.warming.add(url)
+
+        def run():
+            try: self.fetch(url, downloader)
+            finally:
+                with self.stats_lock:
+                    self.warming.discard(url)
+        threading.Thread(target=run, daemon=True).start()
+
+    def _evict(self):
+        with self.stats_lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, _, size in entries)
+            for _, path, size in entries:
+                if total <= self.max_bytes: break
+                try:
+                    os.remove(path)
+                    total -= size
+                    self.counters['evicted'] += 1
+                except OSError: pass
+            self.bytes = total
+
+    def stats(self):
+        with self.stats_lock:
+            hits, misses = self.counters['hits'], self.counters['misses']
+            return dict(self.counters, bytes=self.bytes, max_bytes=self.max_bytes,
+                        hit_rate=round(hits / (hits + misses), 3) if hits + misses else 0)
+
+
+class _ZipStreamSink(io.RawIOBase):
+    """Write-only, non-seekable file for ZipFile whose bytes are drained by a generator."""
+
+    def __init__(self):
+        self.chunks = []
+        self.pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.chunks.append(bytes(b))
+        self.pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self.pos
 
-        return minidom.parseString(ET.tostring(root)).toprettyxml(indent="    ")
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
 
 
 class ThemeDownloader:
+    _local = threading.local()
+
     def __init__(self, max_workers=5):
         self.max_workers = max_workers
         self.theme_mgr = ThemeCacheManager()
+        self.audio_cache = AudioCache()
 
     def sanitize_filename(self, name):
         return re.sub(r'[\\/*?:"<>|]', "", str(name)).strip()
@@ -344,16 +948,68 @@ class ThemeDownloader:
     def get_theme_links(self, mal_id):
         return self.theme_mgr.get_themes(mal_id)
 
+    def _session(self):
+        # One scraper per worker thread, reused across tracks
+        rq = getattr(self._local, 'rq', None)
+        if rq is None:
+            rq = self._local.rq = cloudscraper.create_scraper()
+        return rq
+
+    def _download_to(self, url, f):
+        """Download `url` into the binary file `f`, resuming with Range after a dropped connection."""
+        for attempt in range(Config.DOWNLOAD_RETRIES + 1):
+            if attempt: time.sleep(min(2 ** attempt, 10))
+            offset = f.tell()
+            headers = {'Range': f'bytes={offset}-'} if offset else {}
+            try:
+                with self._session().get(url, stream=True, timeout=20, headers=headers) as r:
+                    if r.status_code == 416 and offset:
+                        return True
+                    if r.status_code not in (200, 206):
+                        if r.status_code < 500 and r.status_code != 429: return False
+                        continue
+                    if r.status_code == 200 and offset:
+                        # Server ignored the Range header, start over
+                        f.seek(0)
+                        f.truncate()
+                    length = r.headers.get('Content-Length')
+                    expected = f.tell() + int(length) if length and not r.headers.get('Content-Encoding') else None
+                    for chunk in r.iter_content(chunk_size=64*1024):
+                        f.write(chunk)
+                    if expected is None or f.tell() >= expected:
+                        return True
+            except Exception:
+                continue
+        return False
+
     def _download_file(self, url, path):
+        # Write to a .part file and rename, so a failed track never looks complete
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
         try:
             os.makedirs(os.path.dirname(path), exist_ok=True)
-            with cloudscraper.create_scraper().get(url, stream=True, timeout=20) as r:
-                if r.status_code == 200:
-                    with open(path, 'wb') as f: shutil.copyfileobj(r.raw, f, length=1024*1024)
-                    return True
+            with open(tmp_path, 'wb') as f:
+                ok = self._download_to(url, f)
+            if ok:
+                os.replace(tmp_path, path)
+                return True
         except: pass
+        try: os.remove(tmp_path)
+        except OSError: pass
         return False
 
+    def _fetch_track(self, url):
+        path = self.audio_cache.fetch(url, self)
+        if path:
+            try: return open(path, 'rb')
+            except OSError: pass
+        # Small tracks stay in memory, larger ones spill to an anonymous temp file
+        buf = tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024)
+        if self._download_to(url, buf):
+            buf.seek(0)
+            return buf
+        buf.close()
+        return None
+
     def process_anime_task(self, item, temp_dir):
         songs = self.get_theme_links(item['mal_id'])
         if not songs: return None
@@ -364,14 +1020,22 @@ class ThemeDownloader:
             ext = s['link'].split('.')[-1] if s.get('link') else 'ogg'
             fname = f"{s['type']} - {self.sanitize_filename(s['title'])}.{ext}"
             full_path = os.path.join(temp_dir, s_title, fname)
-            if self._download_file(s['link'], full_path):
+            cached = self.audio_cache.fetch(s['link'], self)
+            if not cached: continue
+            try:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                try: os.link(cached, full_path)
+                except OSError: shutil.copyfile(cached, full_path)
                 count += 1
+            except OSError: pass
         
         return {'title': s_title, 'count': count}
 
     def download_and_zip_generator(self, data_list, output_path):
         yield {'msg': f"Preparing {len(data_list)} modules...", 'progress': '0%'}
-        
+        # Warm the theme store in batches so worker threads only hit local cache
+        self.theme_mgr.get_themes_many([item['mal_id'] for item in data_list])
+
         with tempfile.TemporaryDirectory() as temp_dir:
             with ThreadPoolExecutor(max_workers=self.max_workers) as ex:
                 futures = {ex.submit(self.process_anime_task, item, temp_dir): item for item in data_list}
@@ -398,9 +1062,10 @@ class ThemeDownloader:
                     except Exception as e:
                         yield {'msg': f"ERR: {str(e)}", 'progress': f"{int((done_count/total)*90)}%"}
 
-            yield {'msg': "Compressing archive...", 'progress': '95%'}
+            yield {'msg': "Packing archive...", 'progress': '95%'}
             os.makedirs(os.path.dirname(output_path), exist_ok=True)
-            with ZipFile(output_path, 'w', compression=ZIP_DEFLATED) as z:
+            # Audio is already compressed; deflating it only burns CPU
+            with ZipFile(output_path, 'w', compression=ZIP_STORED) as z:
                 for root, dirs, files in os.walk(temp_dir):
                     for file in files:
                         file_path = os.path.join(root, file)
@@ -408,6 +1073,73 @@ class ThemeDownloader:
             
         yield {'msg': "Completed.", 'progress': '100%', 'done': True, 'filename': os.path.basename(output_path)}
 
+    def _archive_tracks(self, item, songs, seen):
+        s_title = self.sanitize_filename(item['title'])
+        tracks = []
+        for s in songs:
+            if not s.get('link'): continue
+            ext = s['link'].split('.')[-1]
+            arcname = f"{s_title}/{s['type']} - {self.sanitize_filename(s['title'])}.{ext}"
+            if arcname in seen: continue
+            seen.add(arcname)
+            tracks.append((arcname, s['link']))
+        return tracks
+
+    def check_tracks_generator(self, data_list):
+        """Resolve the tracks stream_zip_generator would pack, reporting titles without audio."""
+        total = len(data_list)
+        yield {'msg': f"Resolving audio sources for {total} modules...", 'progress': '0%'}
+        themes_map = self.theme_mgr.get_themes_many([item['mal_id'] for item in data_list])
+        seen = set()
+        track_count = 0
+        for done_count, item in enumerate(data_list, 1):
+            tracks = self._archive_tracks(item, themes_map.get(str(item['mal_id']), []), seen)
+            track_count += len(tracks)
+            status = f"Found: {item['title']} ({len(tracks)} tracks)" if tracks else f"Skipped: {item['title']} (No Audio)"
+            yield {'msg': f"[{done_count}/{total}] {status}", 'progress': f"{int(done_count / total * 100)}%"}
+        if not track_count:
+            yield {'error': 'No audio found for the selected titles.'}
+            return
+        yield {'msg': f"{track_count} tracks ready to pack.", 'progress': '100%', 'done': True, 'tracks': track_count}
+
+    def stream_zip_generator(self, data_list):
+        """Yield a ZIP_STORED archive chunk by chunk as each track finishes downloading.
+
+        Tracks that fail to download are listed in a trailing _failed.txt entry.
+        """
+        themes_map = self.theme_mgr.get_themes_many([item['mal_id'] for item in data_list])
+        seen = set()
+        tracks = [t for item in data_list for t in self._archive_tracks(item, themes_map.get(str(item['mal_id']), []), seen)]
+
+        sink = _ZipStreamSink()
+        failed = []
+        ex = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            with ZipFile(sink, 'w', compression=ZIP_STORED) as z:
+                futures = {ex.submit(self._fetch_track, link): arcname for arcname, link in tracks}
+                for f in as_completed(futures):
+                    # Headers are already out, so a failing track is skipped rather than ending the archive early
+                    try: src = f.result()
+                    except Exception: src = None
+                    if src is None:
+                        failed.append(futures[f])
+                        continue
+                    with src:
+                        info = ZipInfo(futures[f], date_time=datetime.now().timetuple()[:6])
+                        info.compress_type = ZIP_STORED
+                        info.file_size = src.seek(0, os.SEEK_END)
+                        src.seek(0)
+                        with z.open(info, 'w') as dst:
+                            for chunk in iter(lambda: src.read(1024*1024), b''):
+                                dst.write(chunk)
+                                yield sink.drain()
+                    yield sink.drain()
+                if failed:
+                    z.writestr('_failed.txt', 'Tracks that could not be downloaded:\n' + '\n'.join(sorted(failed)) + '\n')
+            yield sink.drain()
+        finally:
+            ex.shutdown(wait=False, cancel_futures=True)
+
     def build_playlist_generator(self, data_list, reviews_dict=None):
         if reviews_dict is None:
             reviews_dict = {}
@@ -416,35 +1148,29 @@ class ThemeDownloader:
         playlist = []
         total = len(data_list)
         done_count = 0
-        
-        with ThreadPoolExecutor(max_workers=self.max_workers) as ex:
-            futures = {ex.submit(self.get_theme_links, item['mal_id']): item for item in data_list}
-            for f in as_completed(futures):
-                item = futures[f]
-                done_count += 1
-                try:
-                    songs = f.result()
-                    if songs:
-                        for s in songs:
-                            audio_link = s.get('link', '')
-                            video_link = audio_link.replace('//a.animethemes.moe/', '//v.animethemes.moe/').replace('.ogg', '.webm') if audio_link else ''
-                            
-                            playlist.append({
-                                "anime_ch_name": item['title'],
-                                "anime_img_url": item.get('img_url', ''),
-                                "anime_year": item.get('year') or 'N/A',
-                                "theme_type": s['type'],
-                                "theme_title": s['title'],
-                                "theme_link": audio_link,
-                                "video_link": video_link,
-                                "review_content": reviews_dict.get(item['title'], "")
-                            })
-                    
-                    progress_val = int((done_count / total) * 95)
-                    yield {'msg': f"[{done_count}/{total}] Extracting: {item['title']}", 'progress': f"{progress_val}%"}
-                except Exception as e:
-                    pass
-                    
+
+        # Every uncached batch is fetched concurrently by the async engine
+        themes_map = self.theme_mgr.get_themes_many([item['mal_id'] for item in data_list])
+        for item in data_list:
+            done_count += 1
+            for s in themes_map.get(str(item['mal_id']), []):
+                audio_link = s.get('link', '')
+                video_link = audio_link.replace('//a.animethemes.moe/', '//v.animethemes.moe/').replace('.ogg', '.webm') if audio_link else ''
+
+                playlist.append({
+                    "anime_ch_name": item['title'],
+                    "anime_img_url": item.get('img_url', ''),
+                    "anime_year": item.get('year') or 'N/A',
+                    "theme_type": s['type'],
+                    "theme_title": s['title'],
+                    "theme_link": audio_link,
+                    "video_link": video_link,
+                    "review_content": reviews_dict.get(item['title'], "")
+                })
+
+            progress_val = int((done_count / total) * 95)
+            yield {'msg': f"[{done_count}/{total}] Extracting: {item['title']}", 'progress': f"{progress_val}%"}
+
         import random
         random.shuffle(playlist)
         yield {'msg': "Database compiled. Launching module...", 'progress': '100%', 'done': True, 'playlist': playlist}
@@ -453,69 +1179,112 @@ class MalAnalyticsFetcher:
     def __init__(self):
         self.rq = cloudscraper.create_scraper()
         self.api_url = "https://api.jikan.moe/v4/anime/"
+        self.cache = SqliteKV(Config.CACHE_DB, 'jikan_anime', ttl=Config.JIKAN_DETAIL_TTL)
 
     def _parse_duration(self, d_str):
         if not d_str: return 0
         mins = 0
-        import re
         hr_match = re.search(r'(\d+)\s*hr', d_str)
         min_match = re.search(r'(\d+)\s*min', d_str)
         if hr_match: mins += int(hr_match.group(1)) * 60
         if min_match: mins += int(min_match.group(1))
         return mins
 
+    def parse_anime(self, mal_id, data):
+        # Single mapping from a raw Jikan /anime/{id} payload to what we keep
+        aired_from = (data.get('aired') or {}).get('from')
+        return {
+            'mal_id': mal_id,
+            'title': data.get('title'),
+            'score': data.get('score') or 0,
+            'rank': data.get('rank') or 99999,
+            'popularity': data.get('popularity') or 99999,
+            'source': data.get('source', 'Unknown'),
+            'genres': [g['name'] for g in data.get('genres', [])] + [t['name'] for t in data.get('themes', [])],
+            'studios': [s['name'] for s in data.get('studios', [])],
+            'demographics': [d['name'] for d in data.get('demographics', [])],
+            'episodes': data.get('episodes') or 0,
+            'duration_mins': self._parse_duration(data.get('duration', '')),
+            'img_url': (data.get('images') or {}).get('jpg', {}).get('image_url'),
+            'aired_from': aired_from,
+            'year': int(aired_from[:4]) if aired_from and len(aired_from) >= 4 and aired_from[:4].isdigit() else None
+        }
+
     def fetch_details(self, mal_id):
+        cached = self.cache.get(mal_id)
+        if cached is not None:
+            return cached
         try:
-            time.sleep(0.4)
-            resp = self.rq.get(f"{self.api_url}{mal_id}", timeout=10)
-            
-            if resp.status_code == 429:
-                time.sleep(1.5)
-                return self.fetch_details(mal_id)
-                
+            resp = limited_get(JIKAN_LIMITER, self.rq, f"{self.api_url}{mal_id}", timeout=10)
             if resp.status_code == 200:
-                data = resp.json().get('data', {})
-                return {
-                    'mal_id': mal_id,
-                    'title': data.get('title'),
-                    'score': data.get('score') or 0,
-                    'rank': data.get('rank') or 99999,
-                    'popularity': data.get('popularity') or 99999,
-                    'source': data.get('source', 'Unknown'),
-                    'genres': [g['name'] for g in data.get('genres', [])] + [t['name'] for t in data.get('themes', [])],
-                    'studios': [s['name'] for s in data.get('studios', [])],
-                    'demographics': [d['name'] for d in data.get('demographics', [])],
-                    'episodes': data.get('episodes') or 0,
-                    'duration_mins': self._parse_duration(data.get('duration', ''))
-                }
+                details = self.parse_anime(mal_id, resp.json().get('data', {}))
+                self.cache.put(mal_id, details)
+                return details
         except Exception:
             pass
         return None
 
-def parse_mal_xml(file_stream):
-    tree = ET.parse(file_stream)
-    root = tree.getroot()
-    parsed_data = []
-    
-    for i, anime in enumerate(root.findall('anime')):
-        mal_id_node = anime.find('series_animedb_id')
-        title_node = anime.find('series_title')
-        
-        if mal_id_node is None or title_node is None:
+class MalImportTooLarge(ValueError):
+    pass
+
+
+class _CappedStream:
+    """Read-only wrapper that replays `head` first and refuses to go past `limit` bytes."""
+
+    def __init__(self, stream, limit, head=b''):
+        self.stream = stream
+        self.limit = limit
+        self.head = head
+        self.total = 0
+
+    def read(self, n=-1):
+        if self.head:
+            data = self.head if n < 0 else self.head[:n]
+            self.head = self.head[len(data):]
+            if n < 0: data += self.stream.read()
+        else:
+            data = self.stream.read(n)
+        self.total += len(data)
+        if self.total > self.limit:
+            raise MalImportTooLarge(self.limit)
+        return data
+
+
+def iter_mal_xml(file_stream, max_bytes=Config.MAL_IMPORT_MAX_BYTES):
+    """Yield (index, mal_id, title) per <anime> of a MAL export, plain or gzipped.
+
+    Parsed with iterparse and cleared as it goes, so memory stays flat;
+    more than `max_bytes` of (decompressed) XML raises MalImportTooLarge.
+    """
+    head = file_stream.read(2)
+    if head == b'\x1f\x8b':
+        file_stream = gzip.GzipFile(fileobj=_CappedStream(file_stream, max_bytes, head))
+        head = b''
+    source = _CappedStream(file_stream, max_bytes, head)
+
+    context = ET.iterparse(source, events=('start', 'end'))
+    _, root = next(context)
+    i = 0
+    for event, elem in context:
+        if event != 'end' or elem.tag != 'anime':
             continue
-            
-        mal_id = mal_id_node.text
-        title = title_node.text
-        
-        parsed_data.append({
-            'id': i,
-            'baha_title': title,
-            'mal_title': title,
-            'mal_id': int(mal_id) if mal_id.isdigit() else None,
-            'status': 'MAL Import',
-            'img_url': 'https://cdn.myanimelist.net/img/sp/icon/apple-touch-icon-256.png', 
-            'is_low': False,
-            'year': None 
-        })
-        
-    return parsed_data
\ No newline at end of file
+        mal_id = elem.findtext('series_animedb_id')
+        title = elem.findtext('series_title')
+        if mal_id is not None and title is not None:
+            mal_id = mal_id.strip()
+            yield i, int(mal_id) if mal_id.isdigit() else None, title
+        i += 1
+        root.clear()
+
+
+def parse_mal_xml(file_stream):
+    return [{
+        'id': i,
+        'baha_title': title,
+        'mal_title': title,
+        'mal_id': mal_id,
+        'status': 'MAL Import',
+        'img_url': 'https://cdn.myanimelist.net/img/sp/icon/apple-touch-icon-256.png',
+        'is_low': False,
+        'year': None
+    } for i, mal_id, title in iter_mal_xml(file_stream)]
@@ -0,0 +1,119 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from config import Config
+
+
+class FetchEngine:
+    """Process-wide asyncio loop for batches of upstream JSON GETs.
+
+    Runs on a single background thread, so hundreds of requests can be in
+    flight without a thread each. Concurrency is capped per host.
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(FetchEngine, cls).__new__(cls)
+                cls._instance._start()
+            return cls._instance
+
+    def _start(self):
+        self.loop = asyncio.new_event_loop()
+        self.session = None
+        self.host_limits = {}
+        # Only touched from the loop thread
+        self.counters = {'requests': 0, 'failed': 0, 'bytes': 0}
+        self.fallback_pool = ThreadPoolExecutor(max_workers=Config.FETCH_FALLBACK_WORKERS, thread_name_prefix='fetch-fallback')
+        self.fallback_lock = threading.Lock()
+        self.fallback_until = {}
+        self.fallback_count = 0
+        self.thread = threading.Thread(target=self.loop.run_forever, name='fetch-engine', daemon=True)
+        self.thread.start()
+
+    def _get_session(self):
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=Config.FETCH_MAX_INFLIGHT)
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+
+    async def _get_json(self, req):
+        host = urlsplit(req['url']).hostname
+        sem = self.host_limits.setdefault(host, asyncio.Semaphore(Config.FETCH_PER_HOST))
+        async with sem:
+            self.counters['requests'] += 1
+            try:
+                async with self._get_session().get(
+                    req['url'],
+                    params=req.get('params'),
+                    headers=req.get('headers'),
+                    timeout=aiohttp.ClientTimeout(total=req.get('timeout', 20))
+                ) as resp:
+                    body = await resp.read()
+                    self.counters['bytes'] += len(body)
+                    if resp.status != 200:
+                        return resp.status, None
+                    return resp.status, json.loads(body)
+            except Exception:
+                self.counters['failed'] += 1
+                return None, None
+
+    async def _gather(self, reqs):
+        return await asyncio.gather(*(self._get_json(r) for r in reqs))
+
+    def get_json_many(self, reqs, fallback=None):
+        """Run every request concurrently; returns (status, json) per request, in order.
+
+        Each request is a dict with 'url' and optional 'params', 'headers'
+        and 'timeout'. Failures come back as (None, None).
+
+        `fallback(req) -> (status, json)` is a blocking fetch through a client
+        that can pass Cloudflare challenges (cloudscraper). Requests that fail
+        here for any reason but 404/429 are retried with it on one shared,
+        bounded pool. A host it keeps rescuing bypasses the engine for
+        FETCH_FALLBACK_TTL seconds, so its requests are not made twice.
+        """
+        if not reqs: return []
+        if fallback is None:
+            return asyncio.run_coroutine_threadsafe(self._gather(reqs), self.loop).result()
+
+        hosts = [urlsplit(r['url']).hostname for r in reqs]
+        now = time.monotonic()
+        with self.fallback_lock:
+            direct = [i for i, host in enumerate(hosts) if self.fallback_until.get(host, 0) <= now]
+        results = [(None, None)] * len(reqs)
+        if direct:
+            fut = asyncio.run_coroutine_threadsafe(self._gather([reqs[i] for i in direct]), self.loop)
+            for i, res in zip(direct, fut.result()):
+                results[i] = res
+
+        retry = [i for i, (status, body) in enumerate(results) if body is None and status not in (404, 429)]
+        sent, rescued = {}, {}
+        for i in direct:
+            sent[hosts[i]] = sent.get(hosts[i], 0) + 1
+        direct = set(direct)
+        for i, res in zip(retry, self.fallback_pool.map(fallback, [reqs[i] for i in retry])):
+            if i in direct and res[1] is not None:
+                rescued[hosts[i]] = rescued.get(hosts[i], 0) + 1
+            results[i] = res
+
+        with self.fallback_lock:
+            self.fallback_count += len(retry)
+            for host, n in rescued.items():
+                if 2 * n >= sent[host]:
+                    self.fallback_until[host] = time.monotonic() + Config.FETCH_FALLBACK_TTL
+        return results
+
+    def stats(self):
+        with self.fallback_lock:
+            fallback = {'fallback': self.fallback_count, 'fallback_hosts': sorted(
+                h for h, until in self.fallback_until.items() if until > time.monotonic())}
+        return dict(self.counters, **fallback)
@@ -0,0 +1,341 @@
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Response, request
+
+from config import Config
+from storage import thread_connection
+
+
+class MemoryJobLog:
+    """Event logs of the jobs run by this process."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.cond = threading.Condition()
+        self.jobs = {}
+        self.latest = {}
+
+    def create(self, job_id, key, scope):
+        with self.cond:
+            self._sweep()
+            self.jobs[job_id] = {
+                'key': key, 'scope': scope, 'events': [], 'finished': False, 'cancelled': False, 'updated': time.time()
+            }
+            self.latest[key] = job_id
+
+    def find(self, key):
+        with self.cond:
+            job_id = self.latest.get(key)
+            if job_id not in self.jobs:
+                return None, False
+            job = self.jobs[job_id]
+            return job_id, job['finished'] or job['cancelled']
+
+    def cancel(self, scope):
+        with self.cond:
+            for job in self.jobs.values():
+                if job['scope'] == scope and not job['finished']:
+                    job['cancelled'] = True
+
+    def cancelled(self, job_id):
+        with self.cond:
+            return self.jobs[job_id]['cancelled']
+
+    def exists(self, job_id):
+        with self.cond:
+            return job_id in self.jobs
+
+    def append(self, job_id, event):
+        with self.cond:
+            job = self.jobs[job_id]
+            job['events'].append(json.dumps(event, ensure_ascii=False))
+            job['updated'] = time.time()
+            self.cond.notify_all()
+
+    def finish(self, job_id):
+        with self.cond:
+            self.jobs[job_id]['finished'] = True
+            self.jobs[job_id]['updated'] = time.time()
+            self.cond.notify_all()
+
+    def wait(self, job_id, after, timeout):
+        """Events after seq `after` (waiting up to `timeout` for one), and whether the job has finished."""
+        with self.cond:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return [], True
+            if len(job['events']) <= after and not job['finished']:
+                self.cond.wait(timeout)
+            return list(enumerate(job['events'][after:], after + 1)), job['finished']
+
+    def _sweep(self):
+        cutoff = time.time() - self.ttl
+        for job_id in [j for j, job in self.jobs.items() if job['finished'] and job['updated'] < cutoff]:
+            job = self.jobs.pop(job_id)
+            if self.latest.get(job['key']) == job_id:
+                del self.latest[job['key']]
+
+    def stats(self):
+        with self.cond:
+            running = sum(1 for job in self.jobs.values() if not job['finished'])
+            return {'jobs': len(self.jobs), 'running': running}
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+class SqliteJobLog:
+    """Event logs in the state DB, so any worker process can tail any job.
+
+    Each job records its owning pid, and the owner bumps `updated_at` while
+    it runs. An unfinished job whose owner is gone or has gone quiet (a
+    killed or recycled worker) is closed with an error event when found.
+    """
+
+    def __init__(self, path, ttl, stale_after):
+        self.path = path
+        self.ttl = ttl
+        self.stale_after = stale_after
+        self._local = threading.local()
+        self.last_sweep = 0.0
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, key TEXT NOT NULL, scope TEXT NOT NULL, pid INTEGER NOT NULL, "
+            "finished INTEGER NOT NULL, cancelled INTEGER NOT NULL, updated_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key, updated_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_scope ON jobs (scope, finished)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_events ("
+            "job_id TEXT NOT NULL, seq INTEGER NOT NULL, data TEXT NOT NULL, PRIMARY KEY (job_id, seq))"
+        )
+
+    def _conn(self):
+        return thread_connection(self._local, self.path)
+
+    def create(self, job_id, key, scope):
+        now = time.time()
+        conn = self._conn()
+        if now - self.last_sweep >= 60:
+            self.last_sweep = now
+            with conn:
+                conn.execute('BEGIN')
+                conn.execute(
+                    "DELETE FROM job_events WHERE job_id IN "
+                    "(SELECT job_id FROM jobs WHERE finished = 1 AND updated_at < ?)", (now - self.ttl,)
+                )
+                conn.execute("DELETE FROM jobs WHERE finished = 1 AND updated_at < ?", (now - self.ttl,))
+        conn.execute(
+            "INSERT INTO jobs (job_id, key, scope, pid, finished, cancelled, updated_at) VALUES (?, ?, ?, ?, 0, 0, ?)",
+            (job_id, key, scope, os.getpid(), now)
+        )
+
+    def _dead(self, pid, updated_at):
+        return time.time() - updated_at >= self.stale_after or not _pid_alive(pid)
+
+    def _reap(self, job_id):
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            cur = conn.execute(
+                "UPDATE jobs SET finished = 1, updated_at = ? WHERE job_id = ? AND finished = 0", (time.time(), job_id)
+            )
+            if cur.rowcount:
+                conn.execute(
+                    "INSERT INTO job_events (job_id, seq, data) "
+                    "SELECT ?, COALESCE(MAX(seq), 0) + 1, ? FROM job_events WHERE job_id = ?",
+                    (job_id, json.dumps({'error': 'Job worker stopped unexpectedly.'}), job_id)
+                )
+
+    def find(self, key):
+        row = self._conn().execute(
+            "SELECT job_id, finished, cancelled, pid, updated_at FROM jobs WHERE key = ? ORDER BY updated_at DESC LIMIT 1",
+            (key,)
+        ).fetchone()
+        if row is None:
+            return None, False
+        job_id, finished, cancelled, pid, updated_at = row
+        if not finished and self._dead(pid, updated_at):
+            self._reap(job_id)
+            finished = True
+        return job_id, bool(finished or cancelled)
+
+    def cancel(self, scope):
+        self._conn().execute("UPDATE jobs SET cancelled = 1 WHERE scope = ? AND finished = 0", (scope,))
+
+    def cancelled(self, job_id):
+        row = self._conn().execute("SELECT cancelled FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def exists(self, job_id):
+        return self._conn().execute("SELECT 1 FROM jobs WHERE job_id = ?", (job_id,)).fetchone() is not None
+
+    def append(self, job_id, event):
+        # Writers are serialized by SQLite, so MAX(seq) + 1 cannot race with a reap
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN')
+            conn.execute(
+                "INSERT INTO job_events (job_id, seq, data) "
+                "SELECT ?, COALESCE(MAX(seq), 0) + 1, ? FROM job_events WHERE job_id = ?",
+                (job_id, json.dumps(event, ensure_ascii=False), job_id)
+            )
+            conn.execute("UPDATE jobs SET updated_at = ? WHERE job_id = ?", (time.time(), job_id))
+
+    def finish(self, job_id):
+        self._conn().execute("UPDATE jobs SET finished = 1, updated_at = ? WHERE job_id = ?", (time.time(), job_id))
+
+    def touch(self, job_ids):
+        marks = ','.join('?' * len(job_ids))
+        self._conn().execute(
+            f"UPDATE jobs SET updated_at = ? WHERE finished = 0 AND job_id IN ({marks})", (time.time(), *job_ids)
+        )
+
+    def wait(self, job_id, after, timeout):
+        conn = self._conn()
+        deadline = time.monotonic() + timeout
+        while True:
+            # Read the flag first: once it is set, every event is already committed
+            row = conn.execute("SELECT finished, pid, updated_at FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return [], True
+            if not row[0] and self._dead(row[1], row[2]):
+                self._reap(job_id)
+                continue
+            events = conn.execute(
+                "SELECT seq, data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, after)
+            ).fetchall()
+            if events or row[0] or time.monotonic() >= deadline:
+                return events, bool(row[0])
+            time.sleep(0.25)
+
+    def stats(self):
+        total, running = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(finished = 0), 0) FROM jobs"
+        ).fetchone()
+        return {'jobs': total, 'running': running}
+
+
+class JobManager:
+    """Runs SSE pipelines on background workers, decoupled from the connection.
+
+    A pipeline is a generator of event dicts. Every event is appended to the
+    job's log with a sequence number, and SSE responses only tail that log,
+    so a dropped connection neither stops the work nor repeats it.
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(JobManager, cls).__new__(cls)
+                cls._instance._init_manager()
+            return cls._instance
+
+    def _init_manager(self):
+        self.pool = ThreadPoolExecutor(max_workers=Config.JOB_WORKERS, thread_name_prefix='job')
+        self.start_lock = threading.Lock()
+        self.running = set()
+        if Config.STATE_BACKEND == 'sqlite':
+            self.log = SqliteJobLog(Config.STATE_DB, Config.JOB_TTL, Config.JOB_STALE_AFTER)
+            threading.Thread(target=self._heartbeat, daemon=True).start()
+        else:
+            self.log = MemoryJobLog(Config.JOB_TTL)
+
+    def _heartbeat(self):
+        # Keeps this process's jobs from looking dead to other workers
+        while True:
+            time.sleep(Config.JOB_HEARTBEAT)
+            with self.start_lock:
+                running = list(self.running)
+            if running:
+                try: self.log.touch(running)
+                except Exception: pass
+
+    def _run(self, job_id, pipeline):
+        try:
+            events = pipeline()
+            for event in events:
+                self.log.append(job_id, event)
+                if self.log.cancelled(job_id):
+                    # Stop before the pipeline stores results over its successor's
+                    events.close()
+                    self.log.append(job_id, {'error': 'Superseded by a newer request.'})
+                    break
+        except Exception as e:
+            self.log.append(job_id, {'error': str(e)})
+        finally:
+            self.log.finish(job_id)
+            with self.start_lock:
+                self.running.discard(job_id)
+
+    def start(self, sid, kind, params, pipeline, last_event_id=None):
+        """Returns (job_id, seq) to tail from.
+
+        A Last-Event-ID of a known job resumes it. Otherwise a running job
+        with the same session, kind and params is attached from the start,
+        and anything else (including a job whose worker died or which was
+        superseded) starts `pipeline` afresh.
+        """
+        if last_event_id and ':' in last_event_id:
+            job_id, _, seq = last_event_id.partition(':')
+            if seq.isdigit() and self.log.exists(job_id):
+                return job_id, int(seq)
+
+        key = json.dumps([sid, kind, params], sort_keys=True)
+        with self.start_lock:
+            job_id, finished = self.log.find(key)
+            if job_id and not finished:
+                return job_id, 0
+            job_id = uuid.uuid4().hex
+            self.log.create(job_id, key, json.dumps([sid, kind]))
+            self.running.add(job_id)
+        self.pool.submit(self._run, job_id, pipeline)
+        return job_id, 0
+
+    def supersede(self, sid, kind):
+        """Cancel the session's running `kind` jobs, e.g. once their input queue is replaced."""
+        with self.start_lock:
+            self.log.cancel(json.dumps([sid, kind]))
+
+    def tail(self, job_id, after=0):
+        while True:
+            events, finished = self.log.wait(job_id, after, 15)
+            for seq, data in events:
+                yield f"id: {job_id}:{seq}\ndata: {data}\n\n"
+                after = seq
+            if finished:
+                return
+            if not events:
+                yield ": keep-alive\n\n"
+
+    def stats(self):
+        return self.log.stats()
+
+
+def job_stream(sid, kind, params, pipeline):
+    """SSE response tailing the job for (sid, kind, params), resuming from Last-Event-ID."""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    jobs = JobManager()
+    job_id, after = jobs.start(sid, kind, params, pipeline, last_event_id)
+    return Response(jobs.tail(job_id, after), mimetype='text/event-stream', headers={'X-Accel-Buffering': 'no'})
+
+
+def supersede_jobs(sid, *kinds):
+    jobs = JobManager()
+    for kind in kinds:
+        jobs.supersede(sid, kind)
@@ -0,0 +1,86 @@
+import csv
+import sqlite3
+
+FIELDS = ('ch_name', 'mal_id', 'mal_title', 'img_url', 'mal_year')
+
+
+def normalize_row(row):
+    """Clean a CSV/sheet row into a mapping entry, or None if it has no usable ch_name/mal_id."""
+    ch_name = (row.get('ch_name') or '').strip()
+    mal_id = str(row.get('mal_id') or '').strip()
+    if not ch_name or not mal_id.isdigit():
+        return None
+    return {
+        'ch_name': ch_name,
+        'mal_id': int(mal_id),
+        'mal_title': (row.get('mal_title') or '').strip(),
+        'img_url': (row.get('img_url') or '').strip(),
+        'mal_year': str(row.get('mal_year') or '').strip()
+    }
+
+
+class MappingStore:
+    """Compacted ch_name -> MAL mapping: one row per title and one title per MAL id.
+
+    Uses the default rollback journal rather than WAL, so every committed
+    write bumps the file's mtime and running servers pick it up.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS mapping ("
+            "ch_name TEXT PRIMARY KEY, mal_id INTEGER NOT NULL UNIQUE, "
+            "mal_title TEXT NOT NULL, img_url TEXT NOT NULL, mal_year TEXT NOT NULL) WITHOUT ROWID"
+        )
+
+    def rows(self):
+        cur = self.conn.execute(f"SELECT {', '.join(FIELDS)} FROM mapping ORDER BY ch_name")
+        return [dict(zip(FIELDS, r)) for r in cur]
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM mapping").fetchone()[0]
+
+    def merge(self, entries):
+        """Insert new entries in one transaction; existing rows always win.
+
+        Returns (added, duplicates, conflicts). A duplicate repeats a stored
+        ch_name -> mal_id pair; a conflict is an entry whose ch_name or mal_id
+        is already stored with a different counterpart, as (entry, stored row).
+        """
+        added, duplicates, conflicts = 0, 0, []
+        with self.conn:
+            for entry in entries:
+                if entry is None: continue
+                by_name = self._find('ch_name', entry['ch_name'])
+                by_id = self._find('mal_id', entry['mal_id'])
+                if by_name and by_name['mal_id'] == entry['mal_id']:
+                    duplicates += 1
+                elif by_name or by_id:
+                    conflicts.append((entry, by_name or by_id))
+                else:
+                    self.conn.execute(
+                        f"INSERT INTO mapping ({', '.join(FIELDS)}) VALUES (?, ?, ?, ?, ?)",
+                        [entry[f] for f in FIELDS]
+                    )
+                    added += 1
+        return added, duplicates, conflicts
+
+    def _find(self, field, value):
+        row = self.conn.execute(f"SELECT {', '.join(FIELDS)} FROM mapping WHERE {field} = ?", (value,)).fetchone()
+        return dict(zip(FIELDS, row)) if row else None
+
+    def compact(self):
+        self.conn.execute("VACUUM")
+
+    def export_csv(self, path):
+        rows = self.rows()
+        with open(path, mode='w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        return len(rows)
+
+    def close(self):
+        self.conn.close()
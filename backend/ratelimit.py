@@ -0,0 +1,79 @@
+import threading
+import time
+
+from config import Config
+
+
+class RateLimiter:
+    """Token bucket shared by every caller of one upstream API.
+
+    `acquire()` blocks until a token is available. A 429 with Retry-After
+    pauses the whole bucket, not just the thread that received it.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+        self.acquired = 0
+        self.waited = 0.0
+        self.throttled = 0
+        self.gave_up = 0
+
+    def acquire(self):
+        start = time.monotonic()
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    self.acquired += 1
+                    self.waited += now - start
+                    return
+                wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def backoff(self, seconds):
+        with self.lock:
+            self.throttled += 1
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'acquired': self.acquired,
+                'throttled': self.throttled,
+                'gave_up': self.gave_up,
+                'total_wait_s': round(self.waited, 2),
+                'avg_wait_ms': round(self.waited / self.acquired * 1000, 1) if self.acquired else 0
+            }
+
+
+def _retry_after(resp, attempt):
+    try:
+        return max(float(resp.headers.get('Retry-After')), 0.5)
+    except (TypeError, ValueError):
+        return 2 ** attempt
+
+
+def limited_get(limiter, rq, url, max_retries=Config.JIKAN_MAX_RETRIES, **kwargs):
+    """GET through `limiter`, retrying 429s at most `max_retries` times."""
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+        resp = rq.get(url, **kwargs)
+        if resp.status_code != 429:
+            return resp
+        limiter.backoff(_retry_after(resp, attempt))
+    with limiter.lock:
+        limiter.gave_up += 1
+    return resp
+
+
+JIKAN_LIMITER = RateLimiter(Config.JIKAN_RATE_PER_SEC, Config.JIKAN_BURST)
+ANIMETHEMES_LIMITER = RateLimiter(Config.ANIMETHEMES_RATE_PER_SEC, Config.ANIMETHEMES_BURST)
@@ -39,6 +39,7 @@ def log_candidates_to_sheet(candidates):
             
             row_data = [now, item['baha_title'], str(item['mal_id']), item['mal_title'], img_url, img_formula, item['status'], str(item.get('year') or '')]
 
+            # Index hits are logged with the low-confidence rows until the index has a measured track record
             if item['status'] == "High Confidence":
                 high_conf_rows.append(row_data)
             else:
@@ -1,10 +1,226 @@
-# In-memory session state stores
-TEMP_RESULTS = {}
-FINAL_RESULTS = {}
-MUSIC_QUEUE = {}
-USER_SELECTIONS = {}
-GAME_QUEUE = {}
-READY_PLAYLISTS = {}
-ANALYTICS_QUEUE = {}
-ANALYTICS_RESULTS = {}
-MAL_IMPORT_QUEUE = {}
+import json
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+from config import Config
+from storage import thread_connection
+
+
+def _sizeof(value):
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    return len(json.dumps(value, ensure_ascii=False, default=str))
+
+
+class MemoryBackend:
+    """In-process state: one lock, one LRU order and one byte budget for every store."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.lock = threading.RLock()
+        self.data = {}
+        self.lru = OrderedDict()
+        self.bytes = 0
+        self.evicted = 0
+        self.expired = 0
+        self.last_sweep = time.monotonic()
+
+    def _drop(self, slot):
+        value, expires_at, size = self.data.pop(slot)
+        self.lru.pop(slot, None)
+        self.bytes -= size
+
+    def get(self, store, key, ttl):
+        slot = (store, key)
+        with self.lock:
+            value, expires_at, size = self.data[slot]
+            if time.monotonic() >= expires_at:
+                self._drop(slot)
+                self.expired += 1
+                raise KeyError(key)
+            self.data[slot] = (value, time.monotonic() + ttl, size)
+            self.lru.move_to_end(slot)
+            return value
+
+    def set(self, store, key, value, ttl):
+        slot = (store, key)
+        size = _sizeof(value)
+        with self.lock:
+            if slot in self.data:
+                self._drop(slot)
+            self.data[slot] = (value, time.monotonic() + ttl, size)
+            self.lru[slot] = True
+            self.bytes += size
+            self._sweep()
+            while self.bytes > self.max_bytes and len(self.lru) > 1:
+                oldest = next(iter(self.lru))
+                if oldest == slot:
+                    self.lru.move_to_end(slot)
+                    continue
+                self._drop(oldest)
+                self.evicted += 1
+
+    def delete(self, store, key):
+        with self.lock:
+            self._drop((store, key))
+
+    def keys(self, store):
+        with self.lock:
+            now = time.monotonic()
+            return [k for (s, k), (_, expires_at, _) in self.data.items() if s == store and now < expires_at]
+
+    def _sweep(self):
+        now = time.monotonic()
+        if now - self.last_sweep < 60:
+            return
+        self.last_sweep = now
+        for slot in [s for s, (_, expires_at, _) in self.data.items() if now >= expires_at]:
+            self._drop(slot)
+            self.expired += 1
+
+    def stats(self):
+        with self.lock:
+            stores = {}
+            for (store, _), (_, _, size) in self.data.items():
+                st = stores.setdefault(store, {'entries': 0, 'bytes': 0})
+                st['entries'] += 1
+                st['bytes'] += size
+            return {'stores': stores, 'bytes': self.bytes, 'evicted': self.evicted, 'expired': self.expired}
+
+
+class SqliteBackend:
+    """State in one SQLite file, shared by every worker process on the host.
+
+    Values round-trip through JSON, so stores must hold plain data and be
+    reassigned (not mutated in place) to persist changes.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self.last_sweep = 0.0
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS session_state ("
+            "store TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "expires_at REAL NOT NULL, accessed_at REAL NOT NULL, PRIMARY KEY (store, key))"
+        )
+        self._conn().execute("CREATE INDEX IF NOT EXISTS session_state_lru ON session_state (accessed_at)")
+
+    def _conn(self):
+        return thread_connection(self._local, self.path)
+
+    def get(self, store, key, ttl):
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute(
+            "SELECT value FROM session_state WHERE store = ? AND key = ? AND expires_at > ?", (store, key, now)
+        ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        conn.execute(
+            "UPDATE session_state SET expires_at = ?, accessed_at = ? WHERE store = ? AND key = ?",
+            (now + ttl, now, store, key)
+        )
+        return json.loads(row[0])
+
+    def set(self, store, key, value, ttl):
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(
+                "INSERT INTO session_state (store, key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(store, key) DO UPDATE SET value = excluded.value, size = excluded.size, "
+                "expires_at = excluded.expires_at, accessed_at = excluded.accessed_at",
+                (store, key, data, len(data), now + ttl, now)
+            )
+            if now - self.last_sweep >= 60:
+                self.last_sweep = now
+                conn.execute("DELETE FROM session_state WHERE expires_at <= ?", (now,))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM session_state").fetchone()[0]
+            if total > self.max_bytes:
+                rows = conn.execute(
+                    "SELECT store, key, size FROM session_state WHERE NOT (store = ? AND key = ?) ORDER BY accessed_at",
+                    (store, key)
+                ).fetchall()
+                for s, k, size in rows:
+                    if total <= self.max_bytes: break
+                    conn.execute("DELETE FROM session_state WHERE store = ? AND key = ?", (s, k))
+                    total -= size
+
+    def delete(self, store, key):
+        cur = self._conn().execute("DELETE FROM session_state WHERE store = ? AND key = ?", (store, key))
+        if cur.rowcount == 0:
+            raise KeyError(key)
+
+    def keys(self, store):
+        rows = self._conn().execute(
+            "SELECT key FROM session_state WHERE store = ? AND expires_at > ?", (store, time.time())
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def stats(self):
+        rows = self._conn().execute(
+            "SELECT store, COUNT(*), SUM(size) FROM session_state GROUP BY store"
+        ).fetchall()
+        stores = {s: {'entries': n, 'bytes': b} for s, n, b in rows}
+        return {'stores': stores, 'bytes': sum(st['bytes'] for st in stores.values())}
+
+
+def _make_backend():
+    if Config.STATE_BACKEND == 'sqlite':
+        return SqliteBackend(Config.STATE_DB, Config.SESSION_STATE_MAX_BYTES)
+    return MemoryBackend(Config.SESSION_STATE_MAX_BYTES)
+
+
+_backend = _make_backend()
+_stores = []
+
+
+class SessionStore(MutableMapping):
+    """Dict-like per-session store with a sliding TTL on top of the configured backend."""
+
+    def __init__(self, name, ttl=Config.SESSION_TTL):
+        self.name = name
+        self.ttl = ttl
+        _stores.append(name)
+
+    def __getitem__(self, key):
+        return _backend.get(self.name, key, self.ttl)
+
+    def __setitem__(self, key, value):
+        _backend.set(self.name, key, value, self.ttl)
+
+    def __delitem__(self, key):
+        _backend.delete(self.name, key)
+
+    def __iter__(self):
+        return iter(_backend.keys(self.name))
+
+    def __len__(self):
+        return len(_backend.keys(self.name))
+
+
+def state_stats():
+    stats = _backend.stats()
+    for name in _stores:
+        stats['stores'].setdefault(name, {'entries': 0, 'bytes': 0})
+    stats['backend'] = Config.STATE_BACKEND
+    stats['max_bytes'] = Config.SESSION_STATE_MAX_BYTES
+    return stats
+
+
+# Session state stores
+TEMP_RESULTS = SessionStore('TEMP_RESULTS')
+FINAL_RESULTS = SessionStore('FINAL_RESULTS')
+MUSIC_QUEUE = SessionStore('MUSIC_QUEUE')
+USER_SELECTIONS = SessionStore('USER_SELECTIONS')
+GAME_QUEUE = SessionStore('GAME_QUEUE')
+READY_PLAYLISTS = SessionStore('READY_PLAYLISTS')
+ANALYTICS_QUEUE = SessionStore('ANALYTICS_QUEUE')
+ANALYTICS_RESULTS = SessionStore('ANALYTICS_RESULTS')
+MAL_IMPORT_QUEUE = SessionStore('MAL_IMPORT_QUEUE')
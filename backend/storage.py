@@ -0,0 +1,110 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+def thread_connection(local, path):
+    """The calling thread's autocommit WAL connection to `path`, cached on `local`."""
+    conn = getattr(local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        local.conn = conn
+    return conn
+
+
+class SqliteKV:
+    """Small JSON key/value table on top of SQLite (WAL mode).
+
+    Every thread gets its own connection, writes are single-row upserts,
+    and reads only touch the keys that are asked for.
+    """
+
+    def __init__(self, path, table, ttl=None, max_entries=None):
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        self._local = threading.local()
+        self._conn().execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        if max_entries:
+            self._conn().execute(f"CREATE INDEX IF NOT EXISTS {self.table}_age ON {self.table} (updated_at)")
+
+    def _conn(self):
+        return thread_connection(self._local, self.path)
+
+    def _is_fresh(self, updated_at):
+        return self.ttl is None or time.time() - updated_at < self.ttl
+
+    def get(self, key, default=None):
+        row = self._conn().execute(
+            f"SELECT value, updated_at FROM {self.table} WHERE key = ?", (str(key),)
+        ).fetchone()
+        if row is None or not self._is_fresh(row[1]):
+            return default
+        return json.loads(row[0])
+
+    def get_many(self, keys):
+        keys = [str(k) for k in keys]
+        found = {}
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            marks = ','.join('?' * len(chunk))
+            rows = self._conn().execute(
+                f"SELECT key, value, updated_at FROM {self.table} WHERE key IN ({marks})", chunk
+            ).fetchall()
+            for key, value, updated_at in rows:
+                if self._is_fresh(updated_at):
+                    found[key] = json.loads(value)
+        return found
+
+    def put(self, key, value):
+        self.put_many({key: value})
+
+    def put_many(self, items):
+        now = time.time()
+        rows = [(str(k), json.dumps(v, ensure_ascii=False), now) for k, v in items.items()]
+        if not rows: return
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN')
+            conn.executemany(
+                f"INSERT INTO {self.table} (key, value, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                rows
+            )
+        with self._writes_lock:
+            self._writes += 1
+            due = self.max_entries and self._writes % 50 == 0
+        if due:
+            self.prune()
+
+    def prune(self):
+        # Keep only the newest max_entries rows
+        self._conn().execute(
+            f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} "
+            "ORDER BY updated_at DESC LIMIT -1 OFFSET ?)", (self.max_entries,)
+        )
+
+    def items(self):
+        rows = self._conn().execute(f"SELECT key, value, updated_at FROM {self.table}").fetchall()
+        return [(key, json.loads(value)) for key, value, updated_at in rows if self._is_fresh(updated_at)]
+
+    def delete(self, key):
+        self._conn().execute(f"DELETE FROM {self.table} WHERE key = ?", (str(key),))
+
+    def __contains__(self, key):
+        row = self._conn().execute(
+            f"SELECT updated_at FROM {self.table} WHERE key = ?", (str(key),)
+        ).fetchone()
+        return row is not None and self._is_fresh(row[0])
+
+    def __len__(self):
+        return self._conn().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
@@ -1,65 +1,118 @@
-import csv
-import time
+import argparse
+import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from config import Config
-from core_logic import ThemeCacheManager
+from core_logic import ThemeCacheManager, get_mapping_index
+from fetch_engine import FetchEngine
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return None
 
-def sync_themes():
-    if not os.path.exists(Config.CACHE_CSV_FILE):
-        print(f"錯誤：找不到快取檔案 {Config.CACHE_CSV_FILE}")
+def save_checkpoint(path, state):
+    # 先寫暫存檔再替換，避免中斷時留下損毀的檢查點
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def sync_themes(workers=4, batch_size=Config.THEME_BATCH_SIZE, checkpoint=Config.SYNC_CHECKPOINT_FILE, fresh=False):
+    # 對照表來源：已建立 mal_id.db 時使用資料庫，否則讀取 CSV
+    ids = [str(mal_id) for mal_id in get_mapping_index().by_id]
+    if not ids:
+        print(f"錯誤：找不到對照資料 ({Config.MAPPING_DB} / {Config.CACHE_CSV_FILE})")
         return
 
     # 初始化共用快取管理器
     theme_mgr = ThemeCacheManager()
 
-    print(f"正在讀取 {Config.CACHE_CSV_FILE}...")
-    
-    # 讀取 CSV
-    with open(Config.CACHE_CSV_FILE, mode='r', encoding='utf-8-sig') as f:
-        reader = csv.DictReader(f)
-        rows = list(reader)
+    # 已寫入快取的 ID 即視為完成；檢查點記錄上次失敗的 ID 與累計統計
+    state = None if fresh else load_checkpoint(checkpoint)
+    if state:
+        print(f"從檢查點 {checkpoint} 繼續 (上次失敗 {len(state['failed'])} 筆)")
+    else:
+        state = {'synced': 0, 'failed': [], 'bytes': 0, 'throttled': 0, 'elapsed': 0.0}
+
+    cached = theme_mgr.cache.get_many(ids)
+    retry = set(state['failed'])
+    pending = [i for i in ids if i not in cached and i not in retry] + [i for i in ids if i in retry and i not in cached]
+    print(f"共 {len(ids)} 個 MAL ID，已快取 {len(cached)} 筆，待同步 {len(pending)} 筆 (workers={workers}, batch={batch_size})\n")
+    if not pending:
+        if os.path.exists(checkpoint): os.remove(checkpoint)
+        return
 
-    total = len(rows)
-    print(f"共找到 {total} 筆動畫資料，開始同步音源快取 (theme_cache.json)...\n")
-    
-    new_count = 0
-    skip_count = 0
-    error_count = 0
+    batches = [pending[b:b + batch_size] for b in range(0, len(pending), batch_size)]
+    failed = set()
+    synced = 0
+    start = time.monotonic()
+    fetch_before = FetchEngine().stats()['bytes']
+    throttled_before = theme_mgr.stats()['throttled']
+    last_save = start
+
+    def totals():
+        return {
+            'synced': state['synced'] + synced,
+            'failed': sorted(failed),
+            'bytes': state['bytes'] + FetchEngine().stats()['bytes'] - fetch_before,
+            # Individual 429 responses, not limiter backoff rounds
+            'throttled': state['throttled'] + theme_mgr.stats()['throttled'] - throttled_before,
+            'elapsed': state['elapsed'] + time.monotonic() - start
+        }
+
+    def run_batch(batch):
+        theme_mgr.get_themes_many(batch, batch_size=batch_size)
+        # 失敗的批次不會寫入快取，下次仍會重試
+        return [i for i in batch if i not in theme_mgr.cache]
+
+    ex = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {ex.submit(run_batch, batch): batch for batch in batches}
+        for n, f in enumerate(as_completed(futures), 1):
+            batch = futures[f]
+            try:
+                missed = f.result()
+            except Exception:
+                missed = batch
+            failed.update(missed)
+            synced += len(batch) - len(missed)
+
+            now = time.monotonic()
+            if now - last_save >= Config.SYNC_CHECKPOINT_INTERVAL or n == len(batches):
+                last_save = now
+                save_checkpoint(checkpoint, totals())
+                done = synced + len(failed)
+                print(f"進度 {done}/{len(pending)} | {done / (now - start):.1f} ids/s | 失敗 {len(failed)}", flush=True)
+    except KeyboardInterrupt:
+        save_checkpoint(checkpoint, totals())
+        print(f"\n已中斷，進度已存到 {checkpoint}，重新執行即可繼續。")
+        return
+    finally:
+        ex.shutdown(wait=False, cancel_futures=True)
 
-    for i, row in enumerate(rows, 1):
-        mal_id = row.get('mal_id')
-        ch_name = row.get('ch_name', 'Unknown')
-        
-        if not mal_id or not str(mal_id).strip():
-            continue
-            
-        mal_id_str = str(mal_id).strip()
-        
-        # 檢查是否已存在於快取字典中
-        if mal_id_str in theme_mgr.cache:
-            skip_count += 1
-            print(f"[{i}/{total}] 略過 (已快取): {ch_name}")
-            continue
-            
-        print(f"[{i}/{total}] 抓取中: {ch_name} (MAL ID: {mal_id_str})... ", end="", flush=True)
-        
-        try:
-            # 呼叫管理器抓取並寫入
-            themes = theme_mgr.get_themes(mal_id_str)
-            print(f"成功 (找到 {len(themes)} 首歌曲)")
-            new_count += 1
-            
-            # 友善延遲，避免觸發 429 速率限制
-            time.sleep(0.3)
-            
-        except Exception as e:
-            error_count += 1
-            print(f"失敗 ({str(e)})")
+    summary = totals()
+    elapsed = time.monotonic() - start
+    if not failed and os.path.exists(checkpoint):
+        os.remove(checkpoint)
 
     print("\n--- 同步作業完成 ---")
-    print(f"新增寫入: {new_count} 筆")
-    print(f"略過快取: {skip_count} 筆")
-    print(f"發生錯誤: {error_count} 筆")
+    print(f"新增寫入: {synced} 筆 (累計 {summary['synced']} 筆)")
+    print(f"略過快取: {len(cached)} 筆")
+    print(f"發生錯誤: {len(failed)} 筆")
+    print(f"吞吐量: {(synced + len(failed)) / elapsed:.1f} ids/s，共 {elapsed:.1f} 秒")
+    print(f"下載量: {summary['bytes'] / (1024 * 1024):.1f} MB，429 次數: {summary['throttled']}")
 
 if __name__ == "__main__":
-    sync_themes()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="批次同步 animethemes 音源快取")
+    parser.add_argument('--workers', type=int, default=4, help="同時進行的批次數")
+    parser.add_argument('--batch-size', type=int, default=Config.THEME_BATCH_SIZE, help="每個請求的 MAL ID 數量")
+    parser.add_argument('--checkpoint', default=Config.SYNC_CHECKPOINT_FILE, help="檢查點檔案路徑")
+    parser.add_argument('--fresh', action='store_true', help="忽略既有檢查點")
+    args = parser.parse_args()
+    sync_themes(args.workers, args.batch_size, args.checkpoint, args.fresh)
@@ -1,96 +1,139 @@
+import argparse
 import gspread
 import csv
 import os
 from oauth2client.service_account import ServiceAccountCredentials
 from config import Config
+from mapping_store import MappingStore, normalize_row
 
-def update_local_cache(target_tab_name):
-    print(f"正在連線 Google Sheets... 目標分頁: {target_tab_name}")
-    scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
-    
-    if not os.path.exists(Config.CREDENTIALS_FILE):
-        print(f"錯誤：找不到 {Config.CREDENTIALS_FILE}")
-        return
+def read_csv_rows(path):
+    with open(path, mode='r', encoding='utf-8-sig') as f:
+        return [normalize_row(r) for r in csv.DictReader(f)]
 
-    creds = ServiceAccountCredentials.from_json_keyfile_name(Config.CREDENTIALS_FILE, scope)
-    client = gspread.authorize(creds)
-    
-    try:
-        sheet = client.open(Config.SPREADSHEET_NAME).worksheet(target_tab_name)
-    except Exception as e:
-        print(f"無法開啟工作表 '{target_tab_name}': {e}")
-        return
+def print_conflicts(conflicts):
+    for entry, existing in conflicts:
+        print(f"[衝突] {entry['ch_name']} -> {entry['mal_id']}，已存在 {existing['ch_name']} -> {existing['mal_id']}")
 
-    print("正在讀取候選名單...")
-    rows = sheet.get_all_values()
-    
-    if len(rows) < 2:
-        print(f"分頁 {target_tab_name} 是空的，沒有資料需要更新。\n")
-        return
+def open_store():
+    # 第一次建立資料庫時，先匯入現有的 CSV
+    seed = not os.path.exists(Config.MAPPING_DB) and os.path.exists(Config.CACHE_CSV_FILE)
+    store = MappingStore(Config.MAPPING_DB)
+    if seed:
+        added, duplicates, conflicts = store.merge(read_csv_rows(Config.CACHE_CSV_FILE))
+        print(f"已從 {Config.CACHE_CSV_FILE} 建立 {Config.MAPPING_DB}: {added} 筆 (衝突 {len(conflicts)} 筆)")
+        print_conflicts(conflicts)
+    return store
 
-    existing_keys = set()
-    if os.path.exists(Config.CACHE_CSV_FILE):
-        with open(Config.CACHE_CSV_FILE, mode='r', encoding='utf-8-sig') as f:
-            reader = csv.DictReader(f)
-            for r in reader:
-                if r.get('ch_name'):
-                    existing_keys.add(r['ch_name'].strip())
-    
-    print(f"目前本地快取已有 {len(existing_keys)} 筆資料。")
-
-    new_entries = []
+def read_sheet_rows(sheet):
+    rows = sheet.get_all_values()
+    entries = []
     skipped_count = 0
-    duplicate_count = 0
-    
+
     for row in rows[1:]:
         if len(row) < 5: continue
-        
+
         ch_name = row[1].strip()
-        mal_id = row[2].strip()
-        mal_title = row[3].strip() 
-        img_url = row[4].strip()
-        
         col_7 = row[7].strip().upper() if len(row) > 7 else ""
         col_8 = row[8].strip().upper() if len(row) > 8 else ""
-        
+
         check_status = 'X' if col_7 == 'X' or col_8 == 'X' else ""
         mal_year = col_7 if col_7.isdigit() else (col_8 if col_8.isdigit() else "")
-        
+
         if check_status == 'X':
             skipped_count += 1
             print(f"[排除] {ch_name}")
             continue
-            
-        if ch_name in existing_keys:
-            duplicate_count += 1
+
+        entries.append(normalize_row({
+            'ch_name': ch_name, 'mal_id': row[2], 'mal_title': row[3], 'img_url': row[4], 'mal_year': mal_year
+        }))
+    return entries, skipped_count
+
+def merge_sheets(tab_names):
+    print(f"正在連線 Google Sheets... 目標分頁: {', '.join(tab_names)}")
+    scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
+
+    if not os.path.exists(Config.CREDENTIALS_FILE):
+        print(f"錯誤：找不到 {Config.CREDENTIALS_FILE}")
+        return
+
+    creds = ServiceAccountCredentials.from_json_keyfile_name(Config.CREDENTIALS_FILE, scope)
+    client = gspread.authorize(creds)
+
+    sheets, entries, skipped_count = [], [], 0
+    for tab in tab_names:
+        try:
+            sheet = client.open(Config.SPREADSHEET_NAME).worksheet(tab)
+        except Exception as e:
+            print(f"無法開啟工作表 '{tab}': {e}")
+            continue
+        print(f"正在讀取候選名單: {tab}...")
+        tab_entries, tab_skipped = read_sheet_rows(sheet)
+        if not tab_entries and not tab_skipped:
+            print(f"分頁 {tab} 是空的，沒有資料需要更新。")
             continue
-        
-        new_entries.append([ch_name, mal_id, mal_title, img_url, mal_year])
-        existing_keys.add(ch_name)
-
-    if new_entries:
-        print(f"正在寫入 {len(new_entries)} 筆新資料到 {Config.CACHE_CSV_FILE}...")
-        
-        with open(Config.CACHE_CSV_FILE, mode='a', encoding='utf-8-sig', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerows(new_entries)
-            
-        print("更新完成！")
-        print(f" - 新增: {len(new_entries)} 筆")
-        print(f" - 重複: {duplicate_count} 筆")
-        print(f" - 排除: {skipped_count} 筆")
-        
-        ans = input(f"\n是否要清空 Google Sheet 分頁 '{target_tab_name}' 上的資料? (y/n): ")
+        sheets.append(sheet)
+        entries.extend(tab_entries)
+        skipped_count += tab_skipped
+
+    store = open_store()
+    print(f"目前本地快取已有 {len(store)} 筆資料。")
+
+    # 所有分頁的資料在同一個交易中合併
+    added, duplicates, conflicts = store.merge(entries)
+    store.close()
+    print_conflicts(conflicts)
+    print("更新完成！")
+    print(f" - 新增: {added} 筆")
+    print(f" - 重複: {duplicates} 筆")
+    print(f" - 衝突: {len(conflicts)} 筆")
+    print(f" - 排除: {skipped_count} 筆")
+
+    if not added:
+        print("沒有需要新增的資料。\n")
+        return
+
+    for sheet in sheets:
+        ans = input(f"\n是否要清空 Google Sheet 分頁 '{sheet.title}' 上的資料? (y/n): ")
         if ans.lower() == 'y':
             sheet.resize(rows=1)
             sheet.resize(rows=1000)
             headers = ['Time', 'CH Title', 'MAL ID', 'MAL Title', 'Img URL', 'Preview', 'Status', 'MAL Year', 'Check(X)']
             sheet.update(range_name='A1:I1', values=[headers])
-            print(f"分頁 {target_tab_name} 已清空。\n")
-            
-    else:
-        print("沒有需要新增的資料。\n")
+            print(f"分頁 {sheet.title} 已清空。\n")
+
+def compact(csv_path, rebuild):
+    if rebuild and os.path.exists(Config.MAPPING_DB):
+        os.remove(Config.MAPPING_DB)
+    store = open_store()
+    if csv_path:
+        added, duplicates, conflicts = store.merge(read_csv_rows(csv_path))
+        print(f"已合併 {csv_path}: 新增 {added} 筆，重複 {duplicates} 筆，衝突 {len(conflicts)} 筆")
+        print_conflicts(conflicts)
+    store.compact()
+    print(f"{Config.MAPPING_DB} 共 {len(store)} 筆資料，已壓縮完成。")
+    store.close()
+
+def export(out):
+    store = open_store()
+    count = store.export_csv(out)
+    store.close()
+    print(f"已匯出 {count} 筆資料到 {out}")
 
 if __name__ == "__main__":
-    update_local_cache(Config.CANDIDATE_SHEET_NAME)
-    update_local_cache(Config.DEBUG_SHEET_NAME)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="維護 ch_name -> MAL ID 對照快取")
+    sub = parser.add_subparsers(dest='command')
+    sub.add_parser('merge', help="從 Google Sheets 候選分頁合併新資料 (預設)")
+    p_compact = sub.add_parser('compact', help="合併 CSV 並壓縮資料庫")
+    p_compact.add_argument('--csv', help="要合併的 CSV 檔案")
+    p_compact.add_argument('--rebuild', action='store_true', help=f"刪除現有資料庫後從 {Config.CACHE_CSV_FILE} 重建")
+    p_export = sub.add_parser('export', help="匯出為 CSV 方便人工檢視")
+    p_export.add_argument('--out', default=Config.CACHE_CSV_FILE)
+    args = parser.parse_args()
+
+    if args.command == 'compact':
+        compact(args.csv, args.rebuild)
+    elif args.command == 'export':
+        export(args.out)
+    else:
+        merge_sheets([Config.CANDIDATE_SHEET_NAME, Config.DEBUG_SHEET_NAME])
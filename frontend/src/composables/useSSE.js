@@ -46,6 +46,12 @@ export function useSSE(url) {
     }
     
     eventSource.onerror = (e) => {
+      // The job keeps running server-side; the browser reconnects on its own
+      // and resumes from Last-Event-ID, so only give up once it stops retrying.
+      if (eventSource && eventSource.readyState === EventSource.CONNECTING) {
+        status.value = 'Reconnecting...'
+        return
+      }
       error.value = "Connection lost or server error"
       status.value = 'Disconnected'
       close()